@@ -4,9 +4,11 @@ import numpy as np
 
 import os
 
-class Biddings:
-    def __init__(self, session, n_winners = 3):
-        self.data = pd.read_excel(session.params_path, sheet_name='R&D')
+from registry import Registry
+
+class Biddings(Registry):
+    def __init__(self, df:pd.DataFrame, n_winners = 3):
+        super().__init__(df)
         self.n_winners = n_winners
     def get_winners(self, quarter:int, item:str) -> np.ndarray:
         """
@@ -17,7 +19,8 @@ class Biddings:
             The array of winners from highest to lowest bidders.
         """
         assert item in ['X', 'Y'], "Unknown item passed as parameter : {} instead of 'X' or 'Y'".format(item)
-        winners = self.data.query(f"Quarter == {quarter} and {f'Bid_{item}'} > 0") \
+        bids = self.get_quarter(quarter)
+        winners = bids[bids[f'Bid_{item}'] > 0] \
             .reset_index()[["Company", f"Bid_{item}", f"Partner_1_{item}", f"Partner_2_{item}"]] \
             .sort_values([f"Bid_{item}"], ascending=False, inplace=False) \
             .head(self.n_winners)["Company"].values
@@ -33,8 +36,7 @@ class Biddings:
         item: str
             Either `X` or `Y` and corresponds to the bidding that is being considered
         """
-        partners = self.data.query(f"Quarter == {quarter}") \
-            .query(f"Company == {company}")[[f"Partner_1_{item}", f"Partner_2_{item}"]] \
+        partners = self.get_company(quarter, company)[[f"Partner_1_{item}", f"Partner_2_{item}"]] \
             .values.flatten()
         #removing Nan values : 
         partners = partners[~np.isnan(partners)]
@@ -1,9 +1,14 @@
 from typing import Any
+from itertools import repeat
 import pandas as pd
 import numpy as np
 
 from production import produce_X, produce_Y
-from factories import Factories
+from factories import Factories, FactoryFleet, MAX_FACTORIES
+from salesHelpers.prices import ITEMS, ITEM_INDEX, N_GRADES
+
+# Unit counts are whole numbers of items
+UNITS_DTYPE = np.int64
 
 class Company:
     """
@@ -32,30 +37,33 @@ class Company:
     -------
     __str__() -> str:
         Returns a string representation of the company.
-    get_inventory(item: str) -> np.ndarray:
-        Returns the inventory corresponding to the specified item (X or Y).
+    from_values(id_, name, inventory, prod_inventory, sales_inventory, factories) -> Company:
+        Creates a company from already built inventories and factories.
+    get_inventory(item: str, type_: str, region: int) -> np.ndarray:
+        Returns the inventory corresponding to the specified item (X or Y) in a region.
     get_dict_inventory() -> dict:
         Returns a dictionary containing the grades and quantities for each standard.
     merge_inventories() -> None:
         Merges the production inventory with the current inventory and resets the production_inventory.
     produce(production_decisions: pd.DataFrame, grid: CompatibilityGrid) -> None:
         Processes production decisions for the company based on the given dataframe and compatibility grid.
+    produce_X(X_decisions: pd.DataFrame) -> None:
+        Processes the X production decisions of the company.
+    get_production_capacities(item: str) -> np.ndarray:
+        Returns the max output of the company's factories producing the item.
     process_SO_acquistion(decision: pd.DataFrame) -> None:
         Adds or removes sales offices based on the value in the decision dataframe.
     """
+    __slots__ = ('name', 'id', 'inventory', 'prod_inventory', 'sales_inventory', 'factories',
+                 'max_grades', 'n_sales_offices', 'stockouts', 'goodwill', 'wholeSaler')
 
-    def __init__(self, company_data) -> None:
+    def __init__(self, company_data, store:'InventoryStore' = None, index:int = 0, fleet:FactoryFleet = None) -> None:
         self.name = company_data["Name"]
         self.id = company_data["Id"]
-        self.inventory = Inventory()
-        self.prod_inventory = Inventory()
-        self.sales_inventory = Inventory()
-        self.factories = Factories()
-        self.max_grades = {'X': 0, 'Y': 0}
-        self.n_sales_offices = 0
-        self.stockouts = 0
-        self.goodwill = 1
-        self.wholeSaler = False
+        # Inventories and factories are views on the company's row of the store and fleet (private ones if none are given)
+        self.bind_inventories(InventoryStore(1) if store is None else store, index)
+        self.factories = Factories(fleet, index)
+        self._init_state()
 
     def __str__(self):
         s = "######################\n"
@@ -63,7 +71,36 @@ class Company:
         s += str(self.inventory)
         return s
 
-    def get_inventory(self, item: str, type_: str = 'main') -> np.ndarray:
+    @classmethod
+    def from_values(cls, id_, name:str, inventory:'Inventory', prod_inventory:'Inventory',
+                    sales_inventory:'Inventory', factories:Factories) -> 'Company':
+        """
+        Creates a company from already built inventories and factories (usually views on the market's store and fleet).
+        Used to build many companies at once, without reading a row per company.
+        """
+        company = cls.__new__(cls)
+        company.id, company.name = id_, name
+        company.inventory, company.prod_inventory, company.sales_inventory = inventory, prod_inventory, sales_inventory
+        company.factories = factories
+        company._init_state()
+        return company
+
+    def _init_state(self) -> None:
+        """Sets the attributes every new company starts with (shared by `__init__` and `from_values`)."""
+        self.max_grades = {'X': 0, 'Y': 0}
+        self.n_sales_offices = 0
+        self.stockouts = 0
+        self.goodwill = 1
+        self.wholeSaler = False
+
+    def bind_inventories(self, store:'InventoryStore', index:int) -> None:
+        """Makes the company's inventories views on the row `index` of the given store."""
+        self.inventory = store.get_inventory(index, 'main')
+        self.prod_inventory = store.get_inventory(index, 'production')
+        self.sales_inventory = store.get_inventory(index, 'sales')
+
+    def get_inventory(self, item: str, type_: str = 'main', region: int = 1) -> np.ndarray:
+        """Returns the inventory of `item` held in `region` (starts at 1), or in all regions as [region, grade] if `region` is None."""
         valid_types = {'main', 'production', 'sales'}
         
         if type_ not in valid_types:
@@ -75,7 +112,7 @@ class Company:
             'sales': self.sales_inventory
         }
         
-        return inventory_mapping[type_].get(item)
+        return inventory_mapping[type_].get(item, region)
 
     def get_dict_inventory(self) -> dict:
         """Returns a dictionary containing the grades and quantities for each standard."""
@@ -109,9 +146,9 @@ class Company:
 
         is_stockout = False
         for item in ('X', 'Y'):
-            inventory = self.inventory.get(item)
-            sales = self.sales_inventory.get(item)
-            stockouts = np.logical_and(self.inventory.get('X') != 0, inventory == sales)
+            inventory = self.inventory.get(item, region=None)
+            sales = self.sales_inventory.get(item, region=None)
+            stockouts = np.logical_and(self.inventory.get('X', region=None) != 0, inventory == sales)
             is_stockout = True if is_stockout == True else np.any(stockouts)
         if self.stockouts == 0:
             if is_stockout : 
@@ -130,10 +167,10 @@ class Company:
 
     def merge_inventories(self, reset:bool=True) -> None:
         """Merges production inventory with current inventory and then resets the production_inventory unless specified."""
-        self.inventory = self.inventory.merge(self.prod_inventory)
-        if reset == True : self.prod_inventory = Inventory()
+        self.inventory.merge(self.prod_inventory, out=self.inventory)
+        if reset == True : self.prod_inventory.reset()
 
-    def produce(self, production_decisions: pd.DataFrame, grid, period_parameters, quarter):
+    def produce(self, production_decisions: pd.DataFrame, grid, period_parameters, quarter, log=None):
         """
         Processes production decisions for the company.
 
@@ -146,22 +183,34 @@ class Company:
             The dataframe containing the decision for the specific quarter.
         grid: CompatibilityGrid
             The grid of compatibility (a session attribute).
+        log: ProductionLog
+            If given, the X used by Y production is recorded into it.
         """
         self.prod_inventory.reset()
 
-        company_decisions = production_decisions.query(f"Company == {self.id}")
-        Y_decisions = company_decisions.query(f"Item == 'Y'")
-        X_decisions = company_decisions.query(f"Item == 'X'")
+        company_decisions = production_decisions[production_decisions["Company"] == self.id]
+        Y_decisions = company_decisions[company_decisions["Item"] == 'Y']
 
-        # Produce Y
-        produce_Y(self, Y_decisions, grid, quarter)
+        # Produce Y, the company being the only row of the inventories
+        produce_Y(self.inventory.X[np.newaxis], self.prod_inventory.Y[np.newaxis], Y_decisions,
+                  np.zeros(len(Y_decisions), dtype=int), self.get_production_capacities('Y')[np.newaxis],
+                  np.array([self.max_grades['Y']]), grid, log=log, quarter=quarter,
+                  regions=self.factories.get_regions('Y')[np.newaxis] - 1)
 
         # Producing X (after Y so they can't be used for Y production)
+        self.produce_X(company_decisions[company_decisions["Item"] == 'X'])
+
+        self.update_stockouts(period_parameters.get_values('Stockout impact')[quarter])
+
+    def produce_X(self, X_decisions: pd.DataFrame) -> None:
+        """Processes the given X production decisions, which must all be decisions of the company."""
         for _, decision in X_decisions.iterrows():
             if self.max_grades['X'] >= decision["Grade"]:
                 produce_X(self, decision)
 
-        self.update_stockouts(period_parameters.get_values('Stockout impact')[quarter])
+    def get_production_capacities(self, item: str) -> np.ndarray:
+        """Returns a view on the max output of the company's factory slots producing `item` (NaN for empty slots)."""
+        return self.factories.get_capacities(item)
 
     def process_SO_acquistion(self, decision: pd.DataFrame) -> None:
         """
@@ -198,21 +247,48 @@ class MarketPlayers:
     ----------
     companies : list
         The list of companies in the market.
+    store : InventoryStore
+        The inventories of all companies, the i-th company owning the i-th row.
+    fleet : FactoryFleet
+        The factories of all companies, the i-th company owning the i-th row.
+    n_regions : int
+        The number of regions of the market.
 
     Methods
     -------
     addPlayer(company_data: pd.DataFrame) -> None:
         Adds a new player (company) to the market.
+    merge_inventories(reset: bool) -> None:
+        Merges the production inventories of all companies into their main inventories, in place.
+    produce(production_decisions: ProductionRegistry, grid: CompatibilityGrid, period_parameters, quarter: int) -> None:
+        Processes the production decisions of all companies, the Y decisions of all companies at once.
+    downgrade(type_: str) -> None:
+        Applies downgrading to the inventories of all companies at once.
     """
 
-    def __init__(self, companies_data) -> None:
-        self.companies = []
-        for _, company_data in companies_data.iterrows():
-            self.addPlayer(company_data)
+    def __init__(self, companies_data, n_factory_slots:int = MAX_FACTORIES, n_regions:int = 1) -> None:
+        # The store and fleet are sized up front, and all companies are built from the columns at once
+        n_companies = len(companies_data)
+        self.store = InventoryStore(n_companies, n_regions)
+        self.fleet = FactoryFleet(n_companies, n_factory_slots)
+
+        inventories = {type_: self.store.get_inventories(type_) for type_ in InventoryStore.KINDS}
+        self.companies = list(map(Company.from_values, companies_data["Id"].tolist(), companies_data["Name"].tolist(),
+                                  inventories['main'], inventories['production'], inventories['sales'],
+                                  map(Factories, repeat(self.fleet), range(n_companies))))
 
     def addPlayer(self, company_data: pd.DataFrame):
         """Adds a new player (company) to the market."""
-        self.companies.append(Company(company_data))
+        index = len(self.companies)
+        if index >= len(self.store):
+            # The store is full : it is reallocated and the existing companies are bound to the new one
+            self.store.resize(index + 1)
+            for i, company in enumerate(self.companies):
+                company.bind_inventories(self.store, i)
+        if index >= len(self.fleet):
+            # Factories only hold the fleet and their row, they don't need to be bound again
+            self.fleet.resize(index + 1)
+        self.companies.append(Company(company_data, self.store, index, self.fleet))
 
     def __iter__(self):
         """Defines the iterator on companies."""
@@ -222,6 +298,10 @@ class MarketPlayers:
         """Defines the length of MarketPlayers"""
         return len(self.companies)
 
+    @property
+    def n_regions(self) -> int:
+        return self.store.n_regions
+
     def __getitem__(self, index):
         """Gets a company from the market using indexing."""
         return self.companies[index]
@@ -230,9 +310,46 @@ class MarketPlayers:
         for company in self:
             inventories[str(company.id)] = company.get_inventory(item)[grade]
         return inventories
-    def increment_factories_age(self, period_parameters):
+    def get_inventory_array(self, type_:str = 'main') -> np.ndarray:
+        """Returns a view on the inventories of all companies, of shape [company, region, item (X, Y), grade]."""
+        return self.store.get_kind(type_)
+    def merge_inventories(self, reset:bool=True) -> None:
+        """Merges the production inventories of all companies into their main inventories, in place."""
+        self.store.merge('production', 'main', reset=reset)
+    def produce(self, production_decisions, grid, period_parameters, quarter:int, log=None) -> None:
+        """
+        Processes the production decisions of all companies, as `Company.produce()` does for each of them.
+        Y is produced for all companies at once, on the whole store, before X.
+        Every factory takes the X from, and adds the Y to, the inventories of its own region.
+        Decisions are read from the ProductionRegistry `production_decisions`, already grouped by quarter, company and item.
+        """
+        self.store.reset('production')
+
+        Y_decisions = production_decisions.get_item_decisions(quarter, 'Y')
+        rows = Y_decisions["Company"].map({company.id: row for row, company in enumerate(self.companies)})
+        # Decisions of unknown companies are ignored
+        Y_decisions, rows = Y_decisions[rows.notna()], rows[rows.notna()].to_numpy(dtype=int)
+        produce_Y(self.get_inventory_array('main')[:, :, ITEM_INDEX['X']],
+                  self.get_inventory_array('production')[:, :, ITEM_INDEX['Y']],
+                  Y_decisions, rows, self.get_production_capacities('Y'), self.get_max_grades('Y'), grid,
+                  log=log, quarter=quarter, regions=self.fleet.get_regions('Y') - 1)
+
+        stockout_impact = period_parameters.get_values('Stockout impact')[quarter]
         for company in self.companies:
-            company.increment_factories_age(period_parameters)
+            company.produce_X(production_decisions.get_company_decisions(quarter, company.id, 'X'))
+            company.update_stockouts(stockout_impact)
+    def get_production_capacities(self, item:str) -> np.ndarray:
+        """Returns a view on the max output of the factories producing `item`, of shape [company, factory] (NaN where there is no factory)."""
+        return self.fleet.get_capacities(item)
+    def get_max_grades(self, item:str) -> np.ndarray:
+        """Returns the maximum grade of `item` each company can produce."""
+        return np.array([company.max_grades[item] for company in self.companies])
+    def downgrade(self, type_:str = 'main') -> None:
+        """Applies downgrading to the inventories of all companies at once."""
+        downgrade_inventories(self.get_inventory_array(type_))
+    def increment_factories_age(self, period_parameters):
+        """Increments the age of the factories of all companies at once."""
+        self.fleet.increment_age(period_parameters.get_values('Factory aeging coefficient'))
     def update_wholesaling_status(self, quarter, registry):
         for company in self.companies:
             cid = company.id
@@ -242,95 +359,210 @@ class MarketPlayers:
 
 class Inventory:
     """
-    Represents the inventory of a company.
+    Represents the inventory of a company, in every region.
 
     Attributes
     ----------
     X : np.ndarray
-        The inventory for item X.
+        The inventory for item X, of shape [region, grade] (integer unit counts).
     Y : np.ndarray
-        The inventory for item Y.
+        The inventory for item Y, of shape [region, grade] (integer unit counts).
 
     Methods
     -------
     downgrade() -> None:
         Applies downgrading to the inventory.
-    remove(item: str, grade: int, quantity: int) -> None:
-        Removes the specified quantity of items from the inventory.
-    add(item: str, grade: int, quantity: int) -> None:
-        Adds the specified quantity of items to the inventory.
-    get(item: str) -> np.ndarray:
-        Returns the inventory corresponding to the specified item (X or Y).
-    merge(inventory: Inventory) -> Inventory:
-        Merges another inventory into the current inventory.
+    remove(item: str, grade: int, quantity: int, region: int) -> None:
+        Removes the specified quantity of items from the inventory of a region.
+    add(item: str, grade: int, quantity: int, region: int) -> None:
+        Adds the specified quantity of items to the inventory of a region.
+    get(item: str, region: int) -> np.ndarray:
+        Returns the inventory corresponding to the specified item (X or Y) in a region.
+    merge(inventory: Inventory, out: Inventory = None) -> Inventory:
+        Merges another inventory into the current inventory, in place of `out` if given.
     """
 
-    def __init__(self, X=None, Y=None) -> None:
-        self.X = np.zeros(10) if X is None else X
-        self.Y = np.zeros(10) if Y is None else Y
+    __slots__ = ('X', 'Y')
+
+    def __init__(self, X=None, Y=None, n_regions:int = 1) -> None:
+        self.X = np.zeros((n_regions, N_GRADES), dtype=UNITS_DTYPE) if X is None else X
+        self.Y = np.zeros((n_regions, N_GRADES), dtype=UNITS_DTYPE) if Y is None else Y
 
     def downgrade(self) -> None:
         """
         Applies downgrading to the inventory.
 
-        Keeps the highest grade and converts all lower grades to the lower current grade.
+        Keeps the highest grade and converts all lower grades to the lower current grade, in every region.
         Example: Grades 4, 5, 6, and 7 -> Grade 6 and 5 are converted to grade 4.
         """
-        for lst in [self.X, self.Y]:
-            inv = [(i, quantity) for i, quantity in enumerate(lst) if quantity != 0]
-            if len(inv) <= 2:
-                break
-            summed = sum(quantity for _, quantity in inv[:-1])
-            lst[:] = np.zeros(len(lst))
-            lst[inv[0][0]], lst[inv[-1][0]] = summed, inv[-1][1]
-
-    def remove(self, item, grade, quantity):
-        """Removes the specified quantity of items from the inventory."""
+        downgrade_inventories(self.X)
+        downgrade_inventories(self.Y)
+
+    def remove(self, item, grade, quantity, region=1):
+        """Removes the specified quantity of items from the inventory of `region` (starts at 1). Fractional quantities are truncated to whole units."""
         inventory = self.X if item == "X" else self.Y
-        inventory[grade] -= quantity
+        inventory[region - 1, grade] -= int(quantity)
 
-    def add(self, item, grade, quantity):
-        """Adds the specified quantity of items to the inventory."""
+    def add(self, item, grade, quantity, region=1):
+        """Adds the specified quantity of items to the inventory of `region` (starts at 1). Fractional quantities are truncated to whole units."""
         inventory = self.X if item == "X" else self.Y
-        inventory[grade] += quantity
+        inventory[region - 1, grade] += int(quantity)
 
-    def get(self, item):
-        """Returns the inventory corresponding to the specified item (X or Y)."""
+    def get(self, item, region=1):
+        """
+        Returns the inventory corresponding to the specified item (X or Y) in `region` (starts at 1),
+        or in all regions, of shape [region, grade], if `region` is None.
+        """
         assert item in ["X", "Y"], KeyError("Specified item {} is not known. Try 'X' or 'Y'.".format(item))
-        if item == "X":
-            return self.X
-        if item == "Y":
-            return self.Y
+        inventory = self.X if item == "X" else self.Y
+        return inventory if region is None else inventory[region - 1]
     
     def reset(self):
-        self.X = np.zeros(10)
-        self.Y = np.zeros(10)
+        """Empties the inventory in place (it may be a view on an InventoryStore)."""
+        self.X.fill(0)
+        self.Y.fill(0)
+
+    def merge(self, inventory: 'Inventory', out: 'Inventory' = None) -> 'Inventory':
+        """
+        Merges another inventory into the current inventory.
 
-    def merge(self, inventory: 'Inventory') -> 'Inventory':
-        """Merges another inventory into the current inventory and returns a new inventory object."""
-        new_inventory = Inventory()
-        new_inventory.X = np.add(self.X, inventory.X)
-        new_inventory.Y = np.add(self.Y, inventory.Y)
-        return new_inventory
+        The sum is written into the arrays of `out` without allocating (`out` may be `self` to accumulate in place).
+        If `out` is not given, a new inventory object of the same shape as this one is returned.
+        """
+        if out is None:
+            out = Inventory(np.zeros_like(self.X), np.zeros_like(self.Y))
+        np.add(self.X, inventory.X, out=out.X)
+        np.add(self.Y, inventory.Y, out=out.Y)
+        return out
 
     def __str__(self) -> str:
-        str = "Inventory X:\n"
-        inv_X = [(i, quantity) for i, quantity in enumerate(self.X) if quantity != 0]
-        if len(inv_X) == 0:
-            str += "\tEmpty\n"
+        str = ""
+        n_regions = len(self.X)
+        for region in range(n_regions):
+            if n_regions > 1:
+                str += f"Region {region + 1}:\n"
+            str += "Inventory X:\n"
+            inv_X = [(i, quantity) for i, quantity in enumerate(self.X[region]) if quantity != 0]
+            if len(inv_X) == 0:
+                str += "\tEmpty\n"
+
+            for item in inv_X:
+                str += f"\tGrade {item[0]}: {item[1]} units\n"
+
+            str += "Inventory Y:\n"
+            inv_Y = [(i, quantity) for i, quantity in enumerate(self.Y[region]) if quantity != 0]
+            if len(inv_Y) == 0:
+                str += "\tEmpty"
+
+            for item in inv_Y:
+                str += f"\tGrade {item[0]}: {item[1]} units\n"
 
-        for item in inv_X:
-            str += f"\tGrade {item[0]}: {item[1]} units\n"
+        return str
 
-        str += "Inventory Y:\n"
-        inv_Y = [(i, quantity) for i, quantity in enumerate(self.Y) if quantity != 0]
-        if len(inv_Y) == 0:
-            str += "\tEmpty"
 
-        for item in inv_Y:
-            str += f"\tGrade {item[0]}: {item[1]} units\n"
+class InventoryStore:
+    """
+    The inventories of all market players, stored in one contiguous array.
 
-        return str
+    Company inventories (`Inventory` objects) are views on this array, so that whole-market
+    operations (sales, freight, downgrade...) can run as single NumPy expressions.
+
+    Attributes
+    ----------
+    data : np.ndarray
+        The array of shape [company, kind (main, production, sales), region, item (X, Y), grade].
+        Region `r` is stored at index `r - 1`.
+
+    Methods
+    -------
+    get_kind(type_: str) -> np.ndarray:
+        Returns a view of shape [company, region, item, grade] on one kind of inventory.
+    get_inventory(index: int, type_: str) -> Inventory:
+        Returns the inventory of a company as views on the store.
+    get_inventories(type_: str) -> list:
+        Returns the inventories of all companies as views on the store.
+    reset(type_: str) -> None:
+        Zeroes one kind of inventory for all companies, in place.
+    merge(source: str, destination: str, reset: bool) -> None:
+        Adds one kind of inventory into another for all companies, in place.
+    resize(n_companies: int) -> None:
+        Reallocates the store for the given number of companies, keeping the existing inventories.
+    """
+    __slots__ = ('data',)
+    KINDS = {'main': 0, 'production': 1, 'sales': 2}
+
+    def __init__(self, n_companies: int, n_regions: int = 1) -> None:
+        self.data = np.zeros((n_companies, len(self.KINDS), n_regions, len(ITEMS), N_GRADES), dtype=UNITS_DTYPE)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def n_regions(self) -> int:
+        return self.data.shape[2]
+
+    def get_kind(self, type_: str) -> np.ndarray:
+        """Returns a view of shape [company, region, item, grade] on the requested kind of inventory."""
+        try:
+            return self.data[:, self.KINDS[type_]]
+        except KeyError:
+            raise ValueError("Unknown inventory type '{}'".format(type_)) from None
+
+    def get_inventory(self, index: int, type_: str = 'main') -> 'Inventory':
+        """Returns the inventory of the company at row `index` ; its arrays are views on the store."""
+        inventory = self.get_kind(type_)[index]
+        return Inventory(X=inventory[:, ITEM_INDEX['X']], Y=inventory[:, ITEM_INDEX['Y']])
+
+    def get_inventories(self, type_: str = 'main') -> list:
+        """Returns the inventories of all companies (in row order) ; their arrays are views on the store."""
+        inventories = self.get_kind(type_)
+        return list(map(Inventory, inventories[:, :, ITEM_INDEX['X']], inventories[:, :, ITEM_INDEX['Y']]))
+
+    def reset(self, type_: str) -> None:
+        """Zeroes the requested kind of inventory of all companies, in place."""
+        self.get_kind(type_).fill(0)
+
+    def merge(self, source: str, destination: str = 'main', reset: bool = True) -> None:
+        """Adds the `source` inventories into the `destination` inventories of all companies, then zeroes `source` unless specified."""
+        destination = self.get_kind(destination)
+        np.add(destination, self.get_kind(source), out=destination)
+        if reset:
+            self.reset(source)
+
+    def resize(self, n_companies: int) -> None:
+        """Reallocates the store for the given number of companies. Views on the previous array must be rebound."""
+        data = np.zeros((n_companies,) + self.data.shape[1:], dtype=self.data.dtype)
+        n_kept = min(n_companies, len(self))
+        data[:n_kept] = self.data[:n_kept]
+        self.data = data
+
+
+def downgrade_inventories(inventories: np.ndarray) -> None:
+    """
+    Applies downgrading in place to a batch of inventories.
+
+    In every inventory, the highest grade held is kept and all lower grades are converted to the lowest grade held.
+    Example: Grades 4, 5, 6, and 7 -> Grade 6 and 5 are converted to grade 4.
+
+    Parameters
+    ----------
+    inventories : np.ndarray
+        The inventories, of shape [..., grade] (e.g [company, region, item, grade]). Each row along the last axis
+        is downgraded independently.
+    """
+    held = inventories != 0
+    n_grades = inventories.shape[-1]
+    # First and last grade held in every row (both are 0 / n_grades-1 in empty rows, which are left untouched)
+    first = np.argmax(held, axis=-1)[..., np.newaxis]
+    last = n_grades - 1 - np.argmax(held[..., ::-1], axis=-1)[..., np.newaxis]
+
+    last_quantity = np.take_along_axis(inventories, last, axis=-1)
+    lower_quantity = inventories.sum(axis=-1, keepdims=True) - last_quantity
+
+    inventories[...] = 0
+    np.put_along_axis(inventories, first, lower_quantity, axis=-1)
+    # Written last, so that a row holding a single grade keeps its quantity
+    np.put_along_axis(inventories, last, last_quantity, axis=-1)
 
 
 if __name__ == "__main__":
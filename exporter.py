@@ -5,6 +5,11 @@ from openpyxl.cell.cell import Cell
 from copy import copy
 import numpy as np
 
+from salesHelpers.prices import ITEM_INDEX
+from transactions import MODE_INDEX
+from freight import get_freight_costs
+from transactions import SOLD
+
 
 """
 How to modify the exporter : 
@@ -16,45 +21,54 @@ How to modify the exporter :
 """
 
 
-VERT_SPACING = 19
+VERT_SPACING = 24
 HORI_SPACING = 3
 
 def generate_data(session) -> dict:
-    assert session.n_regions == 1, NotImplementedError(f'Multiple regions are still unsupported, but n_regions = {session.n_regions} was given')
     data = {}
     data['n_companies'] = len(session.marketPlayers)
     data['n_regions'] = session.n_regions
     data['Quarter'] = session.quarter
-    for company in session.marketPlayers:
+    freight_costs = get_freight_costs(session) # [mode, company, region]
+    b2b_volumes = session.b2b_volumes # Shared with freight : [side, mode, company, region, item, grade]
+    # Quantities missing at expedition (Air and Surface), repaired by risk_expediting : [company, region, item, grade]
+    shortfalls = session.expedition_shortfall.sum(axis=0)
+    for company_row, company in enumerate(session.marketPlayers):
         label = f'Company{company.id}'
         data[label] = {}
-        data[label]['Region1'] = {}
-        company_regional_data = data[label]['Region1']
-        company_regional_data['Inventory X'] =      company.get_inventory('X')
-        company_regional_data['Inventory Y'] =      company.get_inventory('Y')
-        company_regional_data['Sales_X'] =          company.get_inventory('X', type_='sales')
-        company_regional_data['Sales_Y'] =          company.get_inventory('Y', type_='sales')
-        company_regional_data['Production_X'] =     company.get_inventory('X', type_='production')
-        company_regional_data['Production_Y'] =     company.get_inventory('Y', type_='production')
-        company_regional_data['B2B_Sales_X'] = aggregate_B2B_sales_by_grade(session.transactions, company, session.quarter, 'X')
-        company_regional_data['B2B_Sales_Y'] = aggregate_B2B_sales_by_grade(session.transactions, company, session.quarter, 'Y')
-
-        ##
-        company_regional_data['Max Grade X'] = company.max_grades['X']
-        company_regional_data['Max Grade Y'] = company.max_grades['Y']
-        
-        # Getting factory ages and number
-        for item in ('X', 'Y'):
-            N_Factories = 0
-            ages = '['
-            for _, factory in company.factories[item].items():
-                ages += str(int(factory.age))
-                ages += ', '
-                N_Factories += 1
-            ages = ages[:-2] + ']' if ages != '[' else 'Empty' # Removes the extra ', '
-            company_regional_data[f'Factory {item} age'] = ages
-            company_regional_data[f'N° Factories {item}'] = N_Factories
-        company_regional_data['N° Sales Office'] = company.n_sales_offices
+        for region in range(1, session.n_regions + 1):
+            data[label][f'Region{region}'] = {}
+            company_regional_data = data[label][f'Region{region}']
+            company_regional_data['Inventory X'] =      company.get_inventory('X', region=region)
+            company_regional_data['Inventory Y'] =      company.get_inventory('Y', region=region)
+            company_regional_data['Sales_X'] =          company.get_inventory('X', type_='sales', region=region)
+            company_regional_data['Sales_Y'] =          company.get_inventory('Y', type_='sales', region=region)
+            company_regional_data['Production_X'] =     company.get_inventory('X', type_='production', region=region)
+            company_regional_data['Production_Y'] =     company.get_inventory('Y', type_='production', region=region)
+            company_regional_data['B2B_Sales_X'] = aggregate_B2B_sales_by_grade(b2b_volumes, company_row, 'X', region)
+            company_regional_data['B2B_Sales_Y'] = aggregate_B2B_sales_by_grade(b2b_volumes, company_row, 'Y', region)
+
+            ##
+            company_regional_data['Max Grade X'] = company.max_grades['X']
+            company_regional_data['Max Grade Y'] = company.max_grades['Y']
+
+            # Getting factory ages and number, for the factories of the region
+            for item in ('X', 'Y'):
+                factory_ages = company.factories.get_ages(item, region)
+                N_Factories = len(factory_ages)
+                ages = '[' + ', '.join(str(int(age)) for age in factory_ages) + ']' if N_Factories else 'Empty'
+                company_regional_data[f'Factory {item} age'] = ages
+                company_regional_data[f'N° Factories {item}'] = N_Factories
+            # Sales offices are counted for the whole company
+            company_regional_data['N° Sales Office'] = company.n_sales_offices
+
+            shortfall = shortfalls[company_row, region - 1]
+            company_regional_data['Shortfall_X'] = shortfall[ITEM_INDEX['X']]
+            company_regional_data['Shortfall_Y'] = shortfall[ITEM_INDEX['Y']]
+
+            # Transfer costs of the company's B2B sales from the region
+            company_regional_data['Freight Cost Air'] = freight_costs[MODE_INDEX['Air'], company_row, region - 1]
+            company_regional_data['Freight Cost Surface'] = freight_costs[MODE_INDEX['Surface'], company_row, region - 1]
     return data
 
 def data_to_matrix(period_data:dict) -> np.ndarray:
@@ -68,6 +82,9 @@ def data_to_matrix(period_data:dict) -> np.ndarray:
     fmt_X_prod = format_inventory(p['Production_X'])
     fmt_Y_prod = format_inventory(p['Production_Y'])
 
+    fmt_X_shortfall = format_inventory(p['Shortfall_X'])
+    fmt_Y_shortfall = format_inventory(p['Shortfall_Y'])
+
 
     matrix = [
         [fmt_X_main[0],fmt_X_main[1],None],
@@ -88,7 +105,12 @@ def data_to_matrix(period_data:dict) -> np.ndarray:
         [p['N° Factories X'], p['Factory X age'], None],
         [p['N° Factories Y'], p['Factory Y age'], None],
         [None, None, None],
-        [p['N° Sales Office']]
+        [p['N° Sales Office'], None, None],
+        [None, None, None],
+        [fmt_X_shortfall[0], fmt_X_shortfall[1], None],
+        [fmt_Y_shortfall[0], fmt_Y_shortfall[1], None],
+        [None, None, None],
+        [round(p['Freight Cost Air'], 2), round(p['Freight Cost Surface'], 2), None]
     ]
     return matrix
 
@@ -121,7 +143,9 @@ def generate_workbook(data) -> Workbook:
               'Production_X (u)', 'Production_Y (u)', '', 
               'Max_Grade_X', 'Max_Grade_Y','', 
               'Factory X | Age', 'Factory Y | Age', ''
-              , 'N° Sales Offices']
+              , 'N° Sales Offices', '',
+              'Shortfall_X (u)', 'Shortfall_Y (u)', '',
+              'Freight Air | Surface']
     
     # Merge cells in Column A and set "Region" value
     start_row = 6
@@ -131,7 +155,7 @@ def generate_workbook(data) -> Workbook:
         # Creating the Region Label
         merge_range = f"A{start_row}:A{end_row - 1}"
         ws.merge_cells(merge_range)
-        ws[f'A{start_row}'].value = f'Region {i}'
+        ws[f'A{start_row}'].value = f'Region {i + 1}'
         ws[f'A{start_row}'].font = Font(bold=True, size=24)
         ws[f'A{start_row}'].alignment = Alignment(textRotation=90, horizontal='center', vertical='center')
         
@@ -229,7 +253,8 @@ def style_borders(wb:Workbook, data) -> Workbook:
         for col_index in range(col_start, col_start + 4*n_companies, 4):
             apply_border_to_square(wb, col_index, row_start, HORI_SPACING, VERT_SPACING)
             add_thin_borders_to_unit(wb, col_index, row_start)
-        row_start += VERT_SPACING + 2
+        # Regions are separated by one row, as in generate_workbook() and populate_workbook()
+        row_start += VERT_SPACING + 1
         
     # Adding header borders
     col_start = 3
@@ -298,68 +323,30 @@ def format_inventory(inventory:np.ndarray) -> str:
 # Helpers #
 ###########
 
-def aggregate_B2B_sales_by_grade(registry, company, quarter, item):
+def aggregate_B2B_sales_by_grade(b2b_volumes, company_row, item, region=1):
     """
-    Calculate the aggregate volume of Business-to-Business (B2B) sales for a specific company, quarter, and item,
-    grouped by grade.
+    Calculate the aggregate volume of Business-to-Business (B2B) sales for a specific company, region and item,
+    grouped by grade (Air and Surface together).
 
     Parameters:
-    - registry (pd.DataFrame): The DataFrame containing sales data.
-    - company (int): The company ID (seller) for which to calculate sales.
-    - quarter (int): The quarter for which to calculate sales.
+    - b2b_volumes (np.ndarray): The quarter's B2B volumes of shape [side, mode, company, region, item, grade],
+      as shared with freight (`session.b2b_volumes`).
+    - company_row (int): The row of the company (seller) for which to calculate sales.
     - item (str): The item or product type for which to calculate sales.
+    - region (int): The selling region (starts at 1).
 
     Returns:
     - list: A list of strings, where each string represents a grade with its corresponding volume in the format '(grade) volume'.
 
     Example:
-    >>> df = pd.DataFrame(...)  # Your sales data DataFrame
-    >>> company_id = 1
-    >>> quarter = 1
-    >>> product_type = 'X'
-    >>> result = aggregate_B2B_sales_by_grade(df, company_id, quarter, product_type)
-    >>> print(result)
-    ['(0) 65000.0']
-
-    If there is only one item in the dictionary, result will be ['(0) 65000.0', 'Empty']:
-    >>> df = pd.DataFrame(...)  # Your sales data DataFrame
-    >>> company_id = 1
-    >>> quarter = 1
-    >>> product_type = 'X'
-    >>> result = aggregate_B2B_sales_by_grade(df, company_id, quarter, product_type)
-    >>> print(result)
-    ['(0) 65000.0', 'Empty']
-    
-    If there are no items in the dictionary, result will be ['Empty']:
-    >>> df = pd.DataFrame(...)  # Your sales data DataFrame
-    >>> company_id = 1
-    >>> quarter = 1
-    >>> product_type = 'Z'  # Product that doesn't exist in the DataFrame
-    >>> result = aggregate_B2B_sales_by_grade(df, company_id, quarter, product_type)
+    >>> result = aggregate_B2B_sales_by_grade(session.b2b_volumes, 0, 'X')
     >>> print(result)
-    ['Empty']
-    """
-    # Filter the DataFrame based on the provided quarter, seller, and product
-    registry = registry.get_quarter(quarter)
-    filtered_df = registry[(registry['Seller'] == company.id) & (registry['Product'] == item)]
-
-    # Group by 'Grade' and calculate the sum of volumes for each grade
-    aggregated_data = filtered_df.groupby('Grade')['Volume'].sum().reset_index()
-
-    # Convert the result to a dictionary
-    result_dict = dict(zip(aggregated_data['Grade'], aggregated_data['Volume']))
-    
-    # Check the length of the dictionary and adjust the output accordingly
-    if len(result_dict) == 1:
-        grade, volume = result_dict.popitem()
-        output = [f'({grade}) {volume}', 'Empty']
-    elif len(result_dict) == 0:
-        output = ['Empty', 'Empty']
-    else:
-        # Transform the dictionary into a list of strings
-        output = [f'({key}) {value}' for key, value in result_dict.items()]
+    ['(0) 65000', '(3) 2000']
 
-    return output
+    If only one grade was sold, result will be ['(0) 65000', 'Empty'].
+    If nothing was sold, result will be ['Empty', 'Empty'].
+    """
+    return format_inventory(b2b_volumes[SOLD, :, company_row, region - 1, ITEM_INDEX[item]].sum(axis=0))
 
 
 
@@ -491,6 +478,16 @@ def add_thin_borders_to_unit(wb, start_col, start_row):
     #Sales offices borders
     add_thin_border(ws[f'{get_column_letter(start_col)}{start_row+18}'])
 
+    #Expedition shortfall borders
+    add_thin_border(ws[f'{get_column_letter(start_col)}{start_row+20}'])
+    add_thin_border(ws[f'{get_column_letter(start_col)}{start_row+21}'])
+    add_thin_border(ws[f'{get_column_letter(start_col+1)}{start_row+20}'])
+    add_thin_border(ws[f'{get_column_letter(start_col+1)}{start_row+21}'])
+
+    #Freight costs borders
+    add_thin_border(ws[f'{get_column_letter(start_col)}{start_row+23}'])
+    add_thin_border(ws[f'{get_column_letter(start_col+1)}{start_row+23}'])
+
 if __name__ == "__main__":
 
     # Test the function with N = 3 and sample data as a 2D matrix
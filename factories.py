@@ -1,7 +1,15 @@
 import os
+import numpy as np
+
+from salesHelpers.prices import ITEMS, ITEM_INDEX
+
+# Default number of factory slots per item and company
+MAX_FACTORIES = 3
 
 
 class Factory:
+    __slots__ = ('region', 'type', 'age', 'max_output', 'optimal_capacity')
+
     def __init__(self, region: int, type_: str, age: int, period_parameters, quarter: int) -> None:
         """
         Represents a factory.
@@ -22,8 +30,8 @@ class Factory:
         self.region = region
         self.type = type_
         self.age = age
-        self.max_output = period_parameters.get_values(f"Max capacity Plant {type_}", quarter)
-        self.optimal_capacity = period_parameters.get_values(f"Optimum capacity {type_}", quarter)
+        self.max_output, self.optimal_capacity = period_parameters.get_quarter_values(
+            [f"Max capacity Plant {type_}", f"Optimum capacity {type_}"], quarter)
 
     def incrementAge(self, aeging_parameter:float = 1) -> None:
         """
@@ -42,11 +50,130 @@ class Factory:
         """Returns the optimal capacity of the factory."""
         return self.max_output * self.optimal_capacity
 
+    @classmethod
+    def from_values(cls, region: int, type_: str, age: int, max_output: float, optimal_capacity: float) -> 'Factory':
+        """Creates a factory from already computed values (no period parameters are read)."""
+        factory = cls.__new__(cls)
+        factory.region, factory.type, factory.age = region, type_, age
+        factory.max_output, factory.optimal_capacity = max_output, optimal_capacity
+        return factory
+
+
+class FactoryFleet:
+    """
+    The factories of all companies, stored as arrays of shape [company, item (X, Y), slot].
+
+    Slot `i` holds the factory number `i + 1` of the company for that item. Empty slots have a NaN max output,
+    so that the max output array can be used directly as the production capacities.
+
+    Attributes
+    ----------
+    occupied : np.ndarray
+        bool array, True where a slot holds a factory.
+    region : np.ndarray
+        int array, the region of the factories.
+    age : np.ndarray
+        int array, the age of the factories.
+    max_output : np.ndarray
+        float array, the max output of the factories (NaN for empty slots).
+    optimal_capacity : np.ndarray
+        float array, the optimal capacity ratio of the factories.
+
+    Methods
+    -------
+    add(row: int, item: str, region: int, age: int, max_output: float, optimal_capacity: float) -> int:
+        Adds a factory in the first free slot of the company at `row` and returns its number.
+    remove(row: int, item: str, factory_index: int) -> None:
+        Removes the factory number `factory_index` of the company at `row`.
+    increment_age(coefficients: np.ndarray, rows=slice(None)) -> None:
+        Increments the age of all factories (of the given rows) and applies the aging coefficients.
+    get_capacities(item: str) -> np.ndarray:
+        Returns a view of shape [company, slot] on the max output of the factories producing `item`.
+    get_regions(item: str) -> np.ndarray:
+        Returns a view of shape [company, slot] on the region of the factories producing `item`.
+    resize(n_companies: int) -> None:
+        Reallocates the fleet for the given number of companies, keeping the existing factories.
+    """
+    __slots__ = ('occupied', 'region', 'age', 'max_output', 'optimal_capacity')
+
+    def __init__(self, n_companies: int, n_slots: int = MAX_FACTORIES) -> None:
+        shape = (n_companies, len(ITEMS), n_slots)
+        self.occupied = np.zeros(shape, dtype=bool)
+        self.region = np.zeros(shape, dtype=np.int64)
+        self.age = np.zeros(shape, dtype=np.int64)
+        self.max_output = np.full(shape, np.nan)
+        self.optimal_capacity = np.zeros(shape)
+
+    def __len__(self):
+        return self.occupied.shape[0]
+
+    @property
+    def n_slots(self) -> int:
+        return self.occupied.shape[2]
+
+    def add(self, row: int, item: str, region: int, age: int, max_output: float, optimal_capacity: float) -> int:
+        """Adds a factory in the first free slot of the company at `row` and returns its number (starts at 1)."""
+        free = np.flatnonzero(~self.occupied[row, ITEM_INDEX[item]])
+        if len(free) == 0:
+            raise ValueError("Error: Could not add factory. Cause: too many factories.")
+        index = (row, ITEM_INDEX[item], free[0])
+        self.occupied[index] = True
+        self.region[index], self.age[index] = region, age
+        self.max_output[index], self.optimal_capacity[index] = max_output, optimal_capacity
+        return free[0] + 1
+
+    def remove(self, row: int, item: str, factory_index: int) -> None:
+        """Removes the factory number `factory_index` (starts at 1) of the company at `row`."""
+        index = (row, ITEM_INDEX[item], factory_index - 1)
+        if not self.occupied[index]:
+            raise KeyError(factory_index)
+        self.occupied[index] = False
+        self.region[index], self.age[index] = 0, 0
+        self.max_output[index], self.optimal_capacity[index] = np.nan, 0
+
+    def increment_age(self, coefficients: np.ndarray, rows=slice(None)) -> None:
+        """
+        Increments the age of all the factories of the given rows (all companies by default),
+        then multiplies their max output by the aging coefficient of their new age.
+        """
+        # Basic indexing : these are views on the fleet arrays
+        age, max_output, occupied = self.age[rows], self.max_output[rows], self.occupied[rows]
+        age[occupied] += 1
+        max_output[occupied] *= np.asarray(coefficients)[age[occupied]]
+
+    def get_capacities(self, item: str) -> np.ndarray:
+        """Returns a view of shape [company, slot] on the max output of the factories producing `item` (NaN for empty slots)."""
+        return self.max_output[:, ITEM_INDEX[item]]
+
+    def get_regions(self, item: str) -> np.ndarray:
+        """Returns a view of shape [company, slot] on the region of the factories producing `item` (0 for empty slots)."""
+        return self.region[:, ITEM_INDEX[item]]
+
+    def resize(self, n_companies: int) -> None:
+        """Reallocates the fleet for the given number of companies, keeping the existing factories."""
+        n_kept = min(n_companies, len(self))
+        for attribute in self.__slots__:
+            array = getattr(self, attribute)
+            resized = np.full((n_companies,) + array.shape[1:], np.nan if attribute == 'max_output' else 0, dtype=array.dtype)
+            resized[:n_kept] = array[:n_kept]
+            setattr(self, attribute, resized)
+
 
 class Factories:
-    def __init__(self):
-        self.factories = {'X': {}, 'Y': {}}
-        self.occupied = {'X': [False, False, False], 'Y': [False, False, False]}
+    """
+    The factories of one company : a view on the row `index` of a FactoryFleet.
+    """
+    __slots__ = ('fleet', 'index')
+
+    def __init__(self, fleet: FactoryFleet = None, index: int = 0, n_slots: int = MAX_FACTORIES):
+        # A private fleet is used if none is given
+        self.fleet = FactoryFleet(1, n_slots) if fleet is None else fleet
+        self.index = index
+
+    @property
+    def occupied(self) -> dict:
+        """The occupied slots, as {item: list of bool}."""
+        return {item: self.fleet.occupied[self.index, ITEM_INDEX[item]].tolist() for item in ITEMS}
 
     def add(self, factory: Factory) -> None:
         """
@@ -57,12 +184,7 @@ class Factories:
         factory : Factory
             The factory to add.
         """
-        try:
-            factory_index = self.occupied[factory.type].index(False) + 1
-            self.factories[factory.type][factory_index] = factory
-            self.occupied[factory.type][factory_index - 1] = True
-        except ValueError:
-            raise ValueError("Error: Could not add factory. Cause: too many factories.")
+        self.fleet.add(self.index, factory.type, factory.region, factory.age, factory.max_output, factory.optimal_capacity)
 
     def add_from_df(self, factory_df, period_parameters, quarter) -> None:
         """
@@ -97,8 +219,7 @@ class Factories:
         factory_type : str
             The type of the factory (X or Y).
         """
-        self.occupied[factory_type][factory_index - 1] = False
-        del self.factories[factory_type][factory_index]
+        self.fleet.remove(self.index, factory_type, factory_index)
 
     def get_factories_production(self, item_type: str) -> list:
         """
@@ -112,13 +233,26 @@ class Factories:
         Returns
         -------
         list
-            The production of factories for the specified item type.
+            The production of factories for the specified item type, in the order of their numbers.
         """
-        production = []
-        for _, factory in self.factories[item_type].items():
-            if factory.type == item_type:
-                production.append(factory.max_output)
-        return production
+        capacities = self.get_capacities(item_type)
+        return capacities[~np.isnan(capacities)].tolist()
+
+    def get_capacities(self, item_type: str) -> np.ndarray:
+        """Returns a view on the max output of the factory slots for the item type (NaN for empty slots)."""
+        return self.fleet.max_output[self.index, ITEM_INDEX[item_type]]
+
+    def get_regions(self, item_type: str) -> np.ndarray:
+        """Returns a view on the region of the factory slots for the item type (0 for empty slots)."""
+        return self.fleet.region[self.index, ITEM_INDEX[item_type]]
+
+    def get_ages(self, item_type: str, region: int = None) -> np.ndarray:
+        """Returns the ages of the factories for the item type (only those of `region` if given), in the order of their numbers."""
+        item = ITEM_INDEX[item_type]
+        selected = self.fleet.occupied[self.index, item]
+        if region is not None:
+            selected = selected & (self.fleet.region[self.index, item] == region)
+        return self.fleet.age[self.index, item][selected]
 
     def increment_age(self, session_parameters) -> None:
         """Increments the age of all factories by one year
@@ -127,19 +261,18 @@ class Factories:
         self: "Factories"
             The set of factories whose ages should be incremented
         """
-        for item in {'X', 'Y'}:
-            occupied = self.occupied[item]
-            factories = self.factories[item]
-            for factory_index, boolean in enumerate(occupied):
-                if boolean:
-                    factory = factories.get(factory_index + 1)  # Factory indices are 1-based
-                    factory.incrementAge(session_parameters.get_values('Factory aeging coefficient'))
+        self.fleet.increment_age(session_parameters.get_values('Factory aeging coefficient'), rows=self.index)
 
     def __iter__(self):
-        return iter(self.factories)
+        return iter(ITEMS)
 
     def __getitem__(self, index):
-        return self.factories[index]
+        """Returns the factories producing the item `index`, as {factory number: Factory}."""
+        item = ITEM_INDEX[index]
+        fleet, row = self.fleet, self.index
+        return {slot + 1: Factory.from_values(fleet.region[row, item, slot], index, fleet.age[row, item, slot],
+                                              fleet.max_output[row, item, slot], fleet.optimal_capacity[row, item, slot])
+                for slot in np.flatnonzero(fleet.occupied[row, item])}
 
 
 if __name__ == "__main__":
@@ -1,89 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from transactions import MODES, MODE_INDEX, SOLD, BOUGHT
+
 #########################################
 # B2B Expeditions, receptions and risks #
 #########################################
 
-def risk_expediting(session) -> dict:
+def risk_expediting(session, mode:str = None) -> None:
     """
-    Checks for each company in the session the airfreight risk_expediting:\n
-    If inventory is negative for a grade, then the grade and value are remembered and the quantities set back to 0.
+    Checks the expediting risk of all companies in the session at once:\n
+    Where an inventory is negative for a grade, the missing quantity is remembered and the inventory set back to 0.
 
-    Returns
-    -------
-    risk_dict: dict
-        Contains the remembered inventory negatives : [Company{ID}][item]['grades', 'quantities'\n
-        # Where grades and quantities are lists of integers.\n
-        NB : Returned dict is likely unused.
-    """
-    risk_dict = {}
-    for company in session.marketPlayers:
-        identifier = f"Company{company.id}"
-        company_risk_dict = {}
-        for item in ("X", "Y"):
-            lst = [(i,-q) for i,q in enumerate(company.get_inventory(item))if q<0]
-            if lst:
-                grades, quantities = zip(*lst)
-                company_risk_dict[item] = {"Grades":list(grades), "Quantities":list(quantities)}
-                for g,q in zip(grades, quantities):
-                    company.inventory.add(item, grade=g, quantity=q)
-        if company_risk_dict:
-            risk_dict[identifier] = company_risk_dict
+    Parameters
+    ----------
+    session: Session
+        The current running session.
+    mode: str
+        The transport mode ('Air' or 'Surface') of the expedition being checked. If given, the missing quantities
+        are added to `session.expedition_shortfall[mode]`, of shape [mode, company, region, item, grade],
+        which is reported in the output.
+    """
+    inventories = session.marketPlayers.get_inventory_array('main')
+    if mode is not None:
+        session.expedition_shortfall[MODE_INDEX[mode]] -= np.minimum(inventories, 0)
 
-    return risk_dict
+    # Repairing the inventories
+    np.maximum(inventories, 0, out=inventories)
+
+def get_b2b_volumes(session) -> np.ndarray:
+    """
+    Returns the volumes sold and bought in the current quarter, of shape [side (SOLD, BOUGHT), mode, company, region, item, grade].
+    They are aggregated once per quarter (see `TransactionRegistry.get_transfer_deltas`) and stored in
+    `session.b2b_volumes`, which freight and the exporter read.
+    """
+    return session.transactions.get_transfer_deltas(session.quarter, len(session.marketPlayers), session.n_regions)
+
+def transfer(session, side:int, mode:str) -> None:
+    """
+    Applies the quarter's B2B transactions of one side and transport mode to the main inventories of all companies.
+    Sold volumes are removed from the sellers, bought volumes are added to the buyers, in the region of the transaction.
+    The volumes are read from `session.b2b_volumes`, set once when the quarter starts.
+    """
+    inventories = session.marketPlayers.get_inventory_array('main')
+    deltas = session.b2b_volumes[side, MODE_INDEX[mode]]
+    if side == SOLD:
+        np.subtract(inventories, deltas, out=inventories)
+    else:
+        np.add(inventories, deltas, out=inventories)
 
 def airfreight_out(session) -> None:
     """
     Processes the airfreight out and updates inventories.\n
     This corresponds to the outgoing airfreight at the begining of each quarter.
     """
-    currentQ = session.quarter
-    cur_registry = session.transactions.get_quarter(currentQ)
-    for company in session.marketPlayers:
-        # Gathering sells from that company
-        sells = cur_registry.query(f"Seller == {company.id} & (`Air / Surface`) == 'Air'").loc[:, ["Product", "Grade", "Volume"]] \
-                       .groupby(['Product', 'Grade']).sum().reset_index()
-        # Updating its inventory
-        for product, grade, volume in sells.values:
-            company.inventory.remove(product, grade, volume)
+    transfer(session, SOLD, 'Air')
 
 def airfreight_in(session) -> None:
     """
     Processes the airfreight_in and updates the inventories.
     This corresponding to incoming airfreiht at the begining of each quarter.
     """
-    currentQ = session.quarter
-    cur_registry = session.transactions.get_quarter(currentQ)
-    for company in session.marketPlayers:
-        # Gathering purchases from that company
-        purchases = cur_registry.query(f"Buyer == {company.id} & (`Air / Surface`) == 'Air'").loc[:, ["Product", "Grade", "Volume"]] \
-                       .groupby(['Product', 'Grade']).sum().reset_index()
-        for product, grade, volume in purchases.values:
-            company.inventory.add(product, grade, volume)
+    transfer(session, BOUGHT, 'Air')
 
 def surface_out(session) -> None:
     """
     Processes the surface freight out and updates inventories. \n
     This corresponds to outgoing freight at the begining of each quarter.
     """
-    currentQ = session.quarter
-    cur_registry = session.transactions.get_quarter(currentQ)
-    for company in session.marketPlayers:
-        # Gathering sells from that company
-        sells = cur_registry.query(f"Seller == {company.id} & (`Air / Surface`) == 'Surface'").loc[:, ["Product", "Grade", "Volume"]] \
-                       .groupby(['Product', 'Grade']).sum().reset_index()
-        # Updating its inventory
-        for product, grade, volume in sells.values:
-            company.inventory.remove(product, grade, volume)
+    transfer(session, SOLD, 'Surface')
 
 def surface_in(session) -> None:
     """
     Processes the surface_in and updates the inventories. \n
     This corresponding to incoming surface freight recieved at the end of each quarter.
     """
-    currentQ = session.quarter
-    cur_registry = session.transactions.get_quarter(currentQ)
-    for company in session.marketPlayers:
-        # Gathering purchases from that company
-        purchases = cur_registry.query(f"Buyer == {company.id} & (`Air / Surface`) == 'Surface'").loc[:, ["Product", "Grade", "Volume"]] \
-                       .groupby(['Product', 'Grade']).sum().reset_index()
-        for product, grade, volume in purchases.values:
-            company.inventory.add(product, grade, volume)
+    transfer(session, BOUGHT, 'Surface')
+
+def get_freight_costs(session) -> np.ndarray:
+    """
+    Returns the transfer costs of the quarter's B2B sales, summed per transport mode, selling company and selling region.
+
+    Returns
+    -------
+    costs: np.ndarray
+        float array of shape [mode (Air, Surface), company, region]. Transactions outside of the transfer grid
+        or of the session's regions are ignored.
+    """
+    n_companies, n_regions = len(session.marketPlayers), session.n_regions
+    transactions = session.transactions.get_quarter(session.quarter)
+    costs = session.transactions.get_transfer_costs(session.quarter, session.transferCosts)
+
+    modes = transactions["Air / Surface"].map(MODE_INDEX).to_numpy(dtype=float)
+    sellers = pd.to_numeric(transactions["Seller"], errors='coerce').to_numpy(dtype=float) - 1
+    regions = pd.to_numeric(transactions["Selling Region"], errors='coerce').to_numpy(dtype=float) - 1
+    valid = (~np.isnan(costs) & ~np.isnan(modes) & (sellers >= 0) & (sellers < n_companies)
+             & (regions >= 0) & (regions < n_regions))
+
+    freight_costs = np.zeros((len(MODES), n_companies, n_regions))
+    np.add.at(freight_costs, tuple(axis[valid].astype(int) for axis in (modes, sellers, regions)), costs[valid])
+    return freight_costs
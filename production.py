@@ -1,23 +1,47 @@
 import os
+import numpy as np
 import pandas as pd
 
+from registry import Registry, partition
 
-class ProductionRegistry:
+# Production preferences for Y : 1 Std for Std, 2 Dlx for Dlx, 3 Dlx for Std, 4 Std for Dlx
+PREFERENCES = (1, 2, 3, 4)
+# Preferences using the Std X grade first
+STD_PRIORITY_PREFERENCES = (1, 4)
+
+
+class ProductionRegistry(Registry):
     """
     Stores all production decisions from all quarters.\n
     Implements
     ----------
     - get_current_registry(quarter) -> pd.DataFrame
     - get_company_registry(companyID) -> pd.DataFrame
+    - get_item_decisions(quarter, item) -> pd.DataFrame
+    - get_company_decisions(quarter, cid, item) -> pd.DataFrame
     """
-    def __init__(self, file_path:os.PathLike) -> None:
-        self.registry = pd.read_excel(file_path, sheet_name='Production')
+    def __init__(self, df:pd.DataFrame) -> None:
+        super().__init__(df)
+        self.registry = df
+        # Both lookups return a reset index ; it is computed once per partition
+        self._current_registries = {quarter: decisions.reset_index() for quarter, decisions in self._quarters.items()}
+        self._company_registries = {cid: decisions.reset_index() for cid, decisions in partition(df, 'Company').items()}
+        self._empty_registry = self._empty.reset_index()
+        # Decisions grouped once by (quarter, item) and (quarter, company, item), for the lookups of production
+        self._item_decisions = partition(df, ['Quarter', 'Item'])
+        self._company_item_decisions = partition(df, ['Quarter', 'Company', 'Item'])
     def get_data(self):
         return self.registry
     def get_current_registry(self, quarter:int) -> pd.DataFrame:
-        return self.registry.query(f"Quarter == {quarter}").reset_index()
+        return self._current_registries.get(quarter, self._empty_registry)
     def get_company_registry(self, cid:int) -> pd.DataFrame:
-        return self.registry.query(f"Company == {cid}").reset_index()
+        return self._company_registries.get(cid, self._empty_registry)
+    def get_item_decisions(self, quarter:int, item:str) -> pd.DataFrame:
+        """Returns the decisions of all companies to produce `item` in the quarter, in their original order."""
+        return self._item_decisions.get((quarter, item), self._empty)
+    def get_company_decisions(self, quarter:int, cid:int, item:str) -> pd.DataFrame:
+        """Returns the decisions of the company to produce `item` in the quarter, in their original order."""
+        return self._company_item_decisions.get((quarter, cid, item), self._empty)
 
 def produce_X(company, decision) -> None:
     """
@@ -30,176 +54,224 @@ def produce_X(company, decision) -> None:
     - If the requested volume is too high, then only maximum volume will be produced.
     """
     item = 'X'
-    factory_index = decision["Factory"] # can be either 1,2 or 3
-    max_volume = company.factories.get_factories_production(item)[factory_index -1]
+    factory_index = decision["Factory"] # between 1 and the number of factory slots
+    capacities = company.factories.get_capacities(item)
+    if not 1 <= factory_index <= len(capacities) or np.isnan(capacities[factory_index - 1]):
+        raise IndexError("Likely cause : factory not found. Ensure factory exists.")
+    max_volume = capacities[factory_index - 1]
     max_grade = company.max_grades[item]
     requested_grade = decision["Grade"]
     requested_volume = decision["Volume"]
     production_volume = requested_volume if requested_volume <= max_volume else max_volume
     if requested_grade > max_grade: production_volume = 0 # If grade is unavailable, production is cancelled
 
-    company.prod_inventory.add(item,requested_grade, production_volume )
+    # The X are produced in the region of the factory
+    region = company.factories.get_regions(item)[factory_index - 1]
+    company.prod_inventory.add(item,requested_grade, production_volume, region)
     
-def produce_Y(company, decisions, grid, quarter) -> None:
+def produce_Y(X_inventories:np.ndarray, Y_production:np.ndarray, decisions:pd.DataFrame, rows:np.ndarray,
+              capacities:np.ndarray, max_grades:np.ndarray, grid, log:'ProductionLog' = None, quarter:int = 0,
+              regions:np.ndarray = None) -> None:
     """
     Purpose
     -------
-    Produce Y products according to preferences for the company and stores production in company.prod_inventory whenever possible.
+    Produces the Y products of all the given decisions, for several companies at once, using their X inventories.
 
     Details
     -------
     - A non possible grade will not be produced
     - An escessive production will be scaled down to the maximum supported by the factory
-    """
-    item = 'Y'
-    preference = decisions.head(1)["Preference"].values
-    usage_records = []
-    # ascending = False means Std decisions will be first
-    # That is the case for Std for Std (1) or Std for Dlx (3)
-    ascending_order = False if preference in [1, 3] else True
-    decisions = decisions.sort_values(by='Standard', inplace=False, ascending=ascending_order)
-    total_X_used = {}
-    
- 
-    for _, decision in decisions.iterrows():
-        if decision["Grade"] > company.max_grades[item] : continue
-        try :
-            max_volume = company.factories.get_factories_production(item)[decision["Factory"] -1]
-        except IndexError:
-            raise IndexError("Likely cause : factory not found. Ensure factory exists.")
-        
-        if max_volume < decision["Volume"]: decision["Volume"] = max_volume
-
-        if preference == 1:
-            X_usage = prod_with_Std_priority(company, decision, grid)
-            # Std for Std
-            # prod_with_Std_priority(company, decision, grid)
-        elif preference == 2:
-            # Dlx for Dlx
-            X_usage = prod_with_Dlx_priority(company, decision, grid)
-        elif preference == 3:
-            # Dlx for Std
-            X_usage = prod_with_Dlx_priority(company, decision, grid)
-        elif preference == 4:
-            # Std for Dlx
-            X_usage = prod_with_Std_priority(company, decision, grid)
-            
-        # total_X_used += sum(X_usage.values())
-        
-        
-        if X_usage is None:
-            X_usage = {}  # Ensure X_usage is always a dictionary
-       
-        for grade, qty in X_usage.items():
-            grade = str(grade)
-            if grade not in total_X_used:
-                total_X_used[grade] = 0
-            total_X_used[grade] += qty
-        print(f"Quarter {quarter}, Company {company.id}:")
-        print(f" Company {company.id}, Production of Y{decision['Grade']}:")
-        for grade, qty in X_usage.items():
-            print(f"  - Grade X{grade} used: {qty}")
-        print("")
-        
-   
-        
-        
-    #print(f"Total X used in the production of Y: {total_X_used}")
-    
-    # print(f" Company {company.id}: Total X used in the production of Y: {total_X_used}")
-    
-    
+    - The preference of a company is the one of its first decision. Std decisions go first for Std for Std (1)
+      and Dlx for Std (3), Dlx decisions go first otherwise.
+    - Each decision uses the X grade of its priority first (Std = lowest grade held, Dlx = highest grade held if
+      at least two grades are held), then the other grade for the remaining volume.
+    - A factory takes the X from, and adds the Y to, the inventories of its own region.
 
-################################################
-# Implementing the production preferences #
-################################################
-def prod_with_Std_priority(company, decision, grid) -> None:
-    """
-    Production method: uses in priority Std chips for Std products.
-    Details
-    -------
-    - If Std X is not enough, uses Dlx X for Std Y.
-    - If Std X is left, Std X is used in priority for Dlx Y.
+    Decisions of different companies don't interact : the decisions ranked k-th of all companies are resolved
+    together, so the number of steps is the largest number of Y decisions made by one company.
+
+    Parameters
+    ----------
+    X_inventories: np.ndarray
+        int array of shape [company, region, grade]. The X inventories the X are taken from (modified in place).
+    Y_production: np.ndarray
+        int array of shape [company, region, grade]. The Y production inventories the Y are added to (modified in place).
+    decisions: pd.DataFrame
+        The Y production decisions.
+    rows: np.ndarray
+        The row of X_inventories and Y_production of each decision's company.
+    capacities: np.ndarray
+        float array of shape [company, factory]. The max output of each Y factory, NaN where there is no factory.
+    max_grades: np.ndarray
+        The maximum Y grade each company can produce.
+    grid: CompatibilityGrid
+        The grid of compatibility (a session attribute).
+    log: ProductionLog
+        If given, every X grade used is recorded into it.
+    quarter: int
+        The current quarter, as recorded into the log.
+    regions: np.ndarray
+        int array of shape [company, factory]. The region index (starting at 0) of each Y factory.
+        All factories are in the first region if not given.
     """
-    
-    inventory = company.get_dict_inventory()
-    X_usage = {}
-    X_std = inventory["X"]["Std"]["Grade"]
-    X_std_qty = inventory["X"]["Std"]["Value"]
+    if decisions.empty:
+        return
 
-    if X_std is None:
-        return  X_usage  # Case inventory is empty -> No production
+    rows = np.asarray(rows)
+    companies = decisions["Company"].to_numpy()
+    grades = decisions["Grade"].to_numpy()
+    producible = grades <= max_grades[rows]
+    preferences = decisions.groupby(rows, sort=False)["Preference"].transform('first').to_numpy()
+    if not np.isin(preferences[producible], PREFERENCES).all():
+        raise ValueError("Unknown production preference. Supported preferences are {}.".format(list(PREFERENCES)))
+    std_priority = np.isin(preferences, STD_PRIORITY_PREFERENCES)
 
-    ratio = grid.get_compatibility(X_std, decision["Grade"])
-    print("ratio", ratio)
-    max_prod_qty = min(X_std_qty // ratio, decision["Volume"])
-    
+    # Decisions are ranked within their company, Std first for preferences 1 and 3 ; ties keep their original order
+    standards = pd.factorize(decisions["Standard"], sort=True)[0]
+    standard_keys = np.where(np.isin(preferences, (1, 3)), -standards, standards)
+    order = np.lexsort((np.arange(len(rows)), standard_keys, rows))
+    ranks = np.empty(len(rows), dtype=int)
+    ranks[order] = pd.Series(rows[order]).groupby(rows[order]).cumcount().to_numpy()
 
-    company.inventory.remove("X", X_std, max_prod_qty * ratio)
-    company.prod_inventory.add("Y", decision["Grade"], max_prod_qty)
-    # added
-    X_usage[X_std] = max_prod_qty * ratio
-    
+    # Requested volumes, scaled down to the factory max output
+    volumes = decisions["Volume"].to_numpy(dtype=float)
+    factories = decisions["Factory"].to_numpy() - 1
+    missing = (factories < 0) | (factories >= capacities.shape[1])
+    max_volumes = capacities[rows, np.where(missing, 0, factories)] if capacities.shape[1] else np.full(len(rows), np.nan)
+    if np.any(producible & (missing | np.isnan(max_volumes))):
+        raise IndexError("Likely cause : factory not found. Ensure factory exists.")
+    volumes = np.where(max_volumes < volumes, max_volumes, volumes)
+    if regions is None:
+        decision_regions = np.zeros(len(rows), dtype=int)
+    else:
+        decision_regions = regions[rows, np.where(missing, 0, factories)] if regions.shape[1] else np.zeros(len(rows), dtype=int)
+
+    n_grades = X_inventories.shape[-1]
+    # (decision, step, X grade, X used, Y produced) of every X grade used, when the log is enabled
+    logged = []
+    for rank in range(ranks.max() + 1):
+        # At most one decision per company : rows are unique below
+        current = np.flatnonzero((ranks == rank) & producible)
+        if len(current) == 0:
+            continue
+        current_rows, current_regions, current_grades = rows[current], decision_regions[current], grades[current]
+
+        held = X_inventories[current_rows, current_regions] != 0
+        n_held = held.sum(axis=1)
+        std = np.argmax(held, axis=1)
+        dlx = n_grades - 1 - np.argmax(held[:, ::-1], axis=1)
+        has_std, has_dlx = n_held >= 1, n_held >= 2
+
+        is_std_priority = std_priority[current]
+        sources = [(np.where(is_std_priority, std, dlx), np.where(is_std_priority, has_std, has_dlx)),
+                   (np.where(is_std_priority, dlx, std), np.where(is_std_priority, has_dlx, has_std))]
+
+        remaining = volumes[current]
+        for step, (X_grades, available) in enumerate(sources):
+            if step > 0:
+                available = available & (remaining > 0)
+            ratios = grid.data[X_grades, current_grades]
+            X_quantities = X_inventories[current_rows, current_regions, X_grades]
+            # An incompatible X grade (ratio 0) can't produce anything. Divided in float, as ratios needn't be integers
+            max_quantities = np.floor(np.divide(X_quantities, ratios, out=np.zeros(len(ratios)), where=ratios > 0))
+            quantities = np.where(available, np.minimum(max_quantities, remaining), 0)
 
-    remaining_prod = decision["Volume"] - max_prod_qty
+            X_used = (quantities * ratios).astype(X_inventories.dtype)
+            X_inventories[current_rows, current_regions, X_grades] -= X_used
+            Y_production[current_rows, current_regions, current_grades] += quantities.astype(Y_production.dtype)
+            remaining = remaining - quantities
 
-    if remaining_prod > 0:
-        X_dlx = inventory["X"]["Dlx"]["Grade"]
-        X_dlx_qty = inventory["X"]["Dlx"]["Value"]
+            if log is not None and log.enabled:
+                used = np.flatnonzero(available)
+                logged.append((current[used], np.full(len(used), step), X_grades[used], X_used[used],
+                               quantities[used].astype(Y_production.dtype)))
 
-        if X_dlx is None:
-            return X_usage
+    if logged:
+        logged_decisions, steps, X_grades, X_used, Y_produced = (np.concatenate(column) for column in zip(*logged))
+        # Recorded decision by decision, in the order of the companies and of their decisions
+        order = np.lexsort((steps, ranks[logged_decisions], rows[logged_decisions]))
+        logged_decisions, X_grades, X_used, Y_produced = (column[order] for column in (logged_decisions, X_grades, X_used, Y_produced))
+        starts = np.flatnonzero(np.r_[True, logged_decisions[1:] != logged_decisions[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], len(logged_decisions)]):
+            decision = logged_decisions[start:stop]
+            log.record(quarter, companies[decision], grades[decision], X_grades[start:stop], X_used[start:stop], Y_produced[start:stop])
 
-        dlx_ratio = grid.get_compatibility(X_dlx, decision["Grade"])
-        max_prod_qty = min(X_dlx_qty // dlx_ratio, remaining_prod)
-        company.inventory.remove("X", X_dlx, max_prod_qty * dlx_ratio)
-        company.prod_inventory.add("Y", decision["Grade"], max_prod_qty)
-        # added
-        X_usage[X_dlx] = max_prod_qty * dlx_ratio
-        
-    return X_usage
 
-def prod_with_Dlx_priority(company, decision, grid) -> None:
+class ProductionLog:
     """
-    Production method: uses in priority Dlx chips for Dlx products.
-    Details
+    Records the X used by every Y production into a preallocated structured array.
+
+    The log is gated by its level : nothing is recorded when it is `OFF` (the default), records are kept when it
+    is `RECORD`, and they are also printed when it is `PRINT`. The array doubles its size whenever it is full.
+
+    Attributes
+    ----------
+    level: int
+        One of ProductionLog.OFF, ProductionLog.RECORD, ProductionLog.PRINT.
+    records: np.ndarray
+        The structured array of the records (only the first `len(log)` rows are filled),
+        with fields 'Quarter', 'Company', 'Grade' (of Y), 'X_Grade', 'X_Used' and 'Y_Produced'.
+
+    Methods
     -------
-    - If Dlx X is not enough, uses Std X for Dlx Y
-    - If Dlx X is left, Dlx X is used in priority for Std Y
+    record(quarter, companies, grades, X_grades, X_used, Y_produced) -> None
+        Appends a batch of records.
+    to_frame() -> pd.DataFrame
+        Returns the records as a DataFrame.
+    to_csv(path) -> None
+        Exports the records to a csv file.
+    to_parquet(path) -> None
+        Exports the records to a parquet file (requires pyarrow or fastparquet).
     """
-    X_usage = {}
-    inventory = company.get_dict_inventory()
-    X_dlx, X_std = inventory["X"]["Dlx"]["Grade"], inventory["X"]["Std"]["Grade"]
-    X_dlx_qty = inventory["X"]["Dlx"]["Value"]
+    OFF, RECORD, PRINT = 0, 1, 2
+    DTYPE = np.dtype([('Quarter', np.int64), ('Company', np.int64), ('Grade', np.int64),
+                      ('X_Grade', np.int64), ('X_Used', np.int64), ('Y_Produced', np.int64)])
 
-    if X_dlx is None and X_std is None:
-        return X_usage
+    def __init__(self, level:int = OFF, capacity:int = 1024) -> None:
+        assert level in (self.OFF, self.RECORD, self.PRINT), ValueError("Unknown log level {}".format(level))
+        self.level = level
+        self.records = np.zeros(capacity, dtype=self.DTYPE)
+        self._size = 0
 
-    ratio = grid.get_compatibility(X_dlx, decision["Grade"]) if X_dlx_qty > 0 else 1
+    @property
+    def enabled(self) -> bool:
+        return self.level > self.OFF
 
-    max_prod_qty = min(X_dlx_qty // ratio, decision["Volume"])
+    def __len__(self):
+        return self._size
 
-    company.inventory.remove("X", X_dlx, max_prod_qty * ratio)
-    company.prod_inventory.add("Y", decision["Grade"], max_prod_qty)
-    # added
-    X_usage[X_dlx] = max_prod_qty * ratio
-    
+    def record(self, quarter:int, companies, grades, X_grades, X_used, Y_produced) -> None:
+        """
+        Appends one record per element of the given arrays, if the log is enabled.
+        At the PRINT level, the batch is printed as the production of one decision (`produce_Y` records one decision per call).
+        """
+        if not self.enabled:
+            return
+        n = len(companies)
+        if self._size + n > len(self.records):
+            records = np.zeros(max(2 * len(self.records), self._size + n), dtype=self.DTYPE)
+            records[:self._size] = self.records[:self._size]
+            self.records = records
 
-    remaining_prod = decision["Volume"] - max_prod_qty
+        new = self.records[self._size:self._size + n]
+        new['Quarter'] = quarter
+        new['Company'], new['Grade'], new['X_Grade'] = companies, grades, X_grades
+        new['X_Used'], new['Y_Produced'] = X_used, Y_produced
+        self._size += n
 
-    if remaining_prod > 0:
-        X_std = inventory["X"]["Std"]["Grade"]
-        X_std_qty = inventory["X"]["Std"]["Value"]
+        if self.level >= self.PRINT and n > 0:
+            # The layout of the production prints the log replaces
+            print(f"Quarter {quarter}, Company {new['Company'][0]}:")
+            print(f" Company {new['Company'][0]}, Production of Y{new['Grade'][0]}:")
+            for record in new:
+                print(f"  - Grade X{record['X_Grade']} used: {record['X_Used']}")
+            print("")
 
-        if X_std is None:
-            return X_usage
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.records[:self._size])
 
-        std_ratio = grid.get_compatibility(X_std, decision["Grade"])
-        max_prod_qty = min(X_std_qty // std_ratio, remaining_prod)
+    def to_csv(self, path:os.PathLike) -> None:
+        self.to_frame().to_csv(path, index=False)
 
-        company.inventory.remove("X", X_std, max_prod_qty * std_ratio)
-        company.prod_inventory.add("Y", decision["Grade"], max_prod_qty)
-        
-        # added
-        
-        X_usage[X_std] = max_prod_qty * std_ratio
+    def to_parquet(self, path:os.PathLike) -> None:
+        self.to_frame().to_parquet(path, index=False)
@@ -0,0 +1,115 @@
+import pandas as pd
+
+
+class Registry:
+    """
+    Base class of the registries read from Data.xlsx (decisions made for all quarters).
+
+    The data is partitioned once by quarter, and by (quarter, company) when the registry has a company column,
+    so that the per-quarter and per-company lookups don't evaluate any query on the whole table.
+    Returned partitions are shared between calls and must not be modified in place.
+
+    Attributes
+    ----------
+    data : pd.DataFrame
+        The registry data for all quarters.
+    company_column : str
+        The column holding the company id, or None if the registry is not company-based.
+
+    Methods
+    -------
+    get_quarter(quarter)
+        Returns the rows of the registry corresponding to the demanded quarter.
+    get_company(quarter, cid)
+        Returns the rows of the registry corresponding to the demanded quarter and company.
+    query(*args, **kwargs)
+        Calls the `query()` method on the registry data DataFrame.
+    """
+    company_column = 'Company'
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        self._set_data(df)
+
+    def _set_data(self, df: pd.DataFrame) -> None:
+        """Replaces the registry data and rebuilds its partitions."""
+        self.data = df
+        self._empty = df.iloc[0:0]
+        self._quarters = partition(df, 'Quarter')
+        if self.company_column is not None:
+            self._companies = partition(df, ['Quarter', self.company_column])
+        else:
+            self._companies = {}
+
+    def get_quarter(self, quarter: int) -> pd.DataFrame:
+        """
+        Returns the rows of the registry corresponding to the demanded quarter.
+
+        Parameters
+        ----------
+        quarter : int
+            The demanded quarter (starts at 1).
+
+        Returns
+        -------
+        pd.DataFrame
+            The registry rows for the specified quarter, with their original index.
+        """
+        return self._quarters.get(quarter, self._empty)
+
+    def get_company(self, quarter: int, cid: int) -> pd.DataFrame:
+        """
+        Returns the rows of the registry corresponding to the demanded quarter and company.
+
+        Parameters
+        ----------
+        quarter : int
+            The demanded quarter (starts at 1).
+        cid : int
+            The id of the company.
+
+        Returns
+        -------
+        pd.DataFrame
+            The registry rows for the specified quarter and company, with their original index.
+        """
+        return self._companies.get((quarter, cid), self._empty)
+
+    def query(self, *args, **kwargs) -> pd.DataFrame:
+        """
+        Calls the `query()` method on the registry data DataFrame.
+
+        Parameters
+        ----------
+        *args : tuple
+            Positional arguments to pass to the `query()` method.
+        **kwargs : dict
+            Keyword arguments to pass to the `query()` method.
+
+        Returns
+        -------
+        pd.DataFrame
+            The result of the query operation on the registry data DataFrame.
+        """
+        return self.data.query(*args, **kwargs)
+
+
+def partition(df: pd.DataFrame, columns) -> dict:
+    """
+    Splits a DataFrame into its groups of rows sharing the same values in `columns`.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame to split.
+    columns : str or list
+        The column(s) defining the groups.
+
+    Returns
+    -------
+    dict
+        {key: rows} where key is the value of `columns` (a tuple if several columns are given).
+        Rows keep their original index and order.
+    """
+    if df.empty:
+        return {}
+    return {key: rows for key, rows in df.groupby(columns, sort=False)}
@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
 import salesHelpers.attractiveness as attr
-class SalesRegistry:
+from salesHelpers.prices import ITEMS, ITEM_INDEX, N_GRADES, PostedPrices, compile_posted_prices
+from registry import Registry
+class SalesRegistry(Registry):
     """
     Contains sales from all quarters.
     Attributes
@@ -10,42 +12,94 @@ class SalesRegistry:
     Implements
     ----------
     - get_quarter(quarter:int) -> The sales DataFrame for the given quarter
+    - get_company(quarter:int, cid:int) -> The sales DataFrame for the given quarter and company
+    - get_posted_prices(quarter:int) -> The PostedPrices arrays for the given quarter
+    - get_market_summary(quarter:int) -> The MarketSummary of the given quarter
     """
-    def __init__(self, df:pd.DataFrame) -> None:
-        self.data = df
-    def get_quarter(self, quarter:int):
-        return self.data.query(f'Quarter == {quarter}')
-    
+    def __init__(self, df:pd.DataFrame, n_companies:int=None, period_parameters=None) -> None:
+        super().__init__(df)
+        if n_companies is None:
+            n_companies = int(pd.to_numeric(df['Company'], errors='coerce').max()) if not df.empty else 0
+        self.n_companies = n_companies
+        # Used for the market climate of the summaries
+        self.period_parameters = period_parameters
+        self._posted_prices = {}
+        self._market_summaries = {}
+
+    def get_posted_prices(self, quarter:int) -> PostedPrices:
+        """Returns the prices posted in the given quarter as dense [company, item, grade] arrays, compiled once per quarter."""
+        if quarter not in self._posted_prices:
+            prices, is_deluxe, average = compile_posted_prices(self.get_quarter(quarter), self.n_companies)
+            previous = self.get_posted_prices(quarter - 1).prices if quarter > 1 else np.zeros_like(prices)
+            self._posted_prices[quarter] = PostedPrices(prices, is_deluxe, previous, average)
+        return self._posted_prices[quarter]
+
+    def get_market_summary(self, quarter:int) -> 'MarketSummary':
+        """Returns the summary of the markets of the given quarter, computed once per quarter."""
+        if quarter not in self._market_summaries:
+            self._market_summaries[quarter] = MarketSummary(self.get_quarter(quarter), quarter, self.period_parameters)
+        return self._market_summaries[quarter]
+
     def get_grades_sold(self, quarter, item):
-        df = self.get_quarter(quarter)
-        Std_array = pd.to_numeric(df[f'Std_{item}'], errors='coerce') # Coerce transforms the unconvertible values to Nan (useful is df is empty), 
-        Dlx_array = pd.to_numeric(df[f'Dlx_{item}'], errors='coerce')
-        grades_sold = np.unique(np.concatenate((Std_array, Dlx_array)))
-        # print("Unique Grades Sold:")
-        # print(grades_sold)  # Print the unique grades sold
-        return np.unique(grades_sold[~np.isnan(grades_sold)])
+        return self.get_market_summary(quarter).grades_sold[ITEM_INDEX[item]]
 
     def get_n_grades_sold(self, quarter, item):
-        grades_sold = self.get_grades_sold(quarter, item)
-        # print(f"Grades sold for quarter {quarter} and item {item}: {grades_sold}")
-        return len(grades_sold)
-    def query(self, *args, **kwargs) -> pd.DataFrame:
-        """
-        Calls the `query()` method on the registry data DataFrame.
-
-        Parameters
-        ----------
-        *args : tuple
-            Positional arguments to pass to the `query()` method.
-        **kwargs : dict
-            Keyword arguments to pass to the `query()` method.
-
-        Returns
-        -------
-        pd.DataFrame
-            The result of the query operation on the registry data DataFrame.
-        """
-        return self.data.query(*args, **kwargs)
+        return self.get_market_summary(quarter).n_grades_sold[ITEM_INDEX[item]]
+
+class MarketSummary:
+    """
+    Summary of the B2C markets of one quarter, shared by the demand computations and reporting.
+    Arrays are indexed by ITEM_INDEX (then by grade).
+
+    Attributes
+    ----------
+    sellers_per_grade: np.ndarray
+        int array of shape [item, grade]. The number of companies selling each grade (in Std or Dlx).
+    grades_sold: list
+        For each item, the sorted array of grades posted by at least one company.
+    n_grades_sold: np.ndarray
+        int array of shape [item]. The number of grades sold.
+    n_std_sellers, n_dlx_sellers: np.ndarray
+        int arrays of shape [item]. The number of companies posting a Std (resp. Dlx) grade.
+    total_advertising: np.ndarray
+        float array of shape [item]. The total advertising amount (NaN if an amount is missing).
+    climate_factor: float
+        The market climate factor of the quarter, as a ratio (None without period parameters).
+    market_potentials: np.ndarray
+        float array of shape [item]. The market potential of each item (None without period parameters).
+    """
+    def __init__(self, sales:pd.DataFrame, quarter:int, period_parameters=None) -> None:
+        n_items = len(ITEMS)
+        companies = sales['Company'].to_numpy()
+        self.sellers_per_grade = np.zeros((n_items, N_GRADES), dtype=int)
+        self.grades_sold = []
+        self.n_std_sellers = np.zeros(n_items, dtype=int)
+        self.n_dlx_sellers = np.zeros(n_items, dtype=int)
+        self.total_advertising = np.zeros(n_items)
+
+        for item, i in ITEM_INDEX.items():
+            Std_array = pd.to_numeric(sales[f'Std_{item}'], errors='coerce').to_numpy(dtype=float) # Coerce transforms the unconvertible values to Nan
+            Dlx_array = pd.to_numeric(sales[f'Dlx_{item}'], errors='coerce').to_numpy(dtype=float)
+            grades = np.concatenate((Std_array, Dlx_array))
+            self.grades_sold.append(np.unique(grades[~np.isnan(grades)]))
+
+            # Each (company, grade) pair counts once, even if the company posts the grade in both standards
+            sellers = np.concatenate((companies, companies))
+            valid = np.isin(grades, np.arange(N_GRADES))
+            pairs = np.unique(np.stack((sellers[valid].astype(float), grades[valid])), axis=1)
+            self.sellers_per_grade[i] = np.bincount(pairs[1].astype(int), minlength=N_GRADES)
+
+            self.n_std_sellers[i] = len(np.unique(companies[sales[f'Std_{item}'].notnull().to_numpy()]))
+            self.n_dlx_sellers[i] = len(np.unique(companies[sales[f'Dlx_{item}'].notnull().to_numpy()]))
+            self.total_advertising[i] = np.sum(sales[f'Advertising_{item}'].to_numpy(dtype=float))
+        self.n_grades_sold = np.array([len(grades_sold) for grades_sold in self.grades_sold])
+
+        if period_parameters is not None:
+            self.climate_factor = period_parameters.get_values('Market climate factor', quarter)/100
+            self.market_potentials = period_parameters.get_quarter_values([f'Mkt potential {item}' for item in ITEMS], quarter)
+        else:
+            self.climate_factor = None
+            self.market_potentials = None
 
 def get_current_market_demand(session, item:str,) -> np.ndarray:
 # def get_current_market_demand(session, item:str,quarter:int) -> np.ndarray:
@@ -60,9 +114,9 @@ def get_current_market_demand(session, item:str,) -> np.ndarray:
 
 def get_num_sellers(session, item:str) -> int:
     parameter = 1
-    n_std = len(np.unique(session.sales_registry.get_quarter(session.quarter).query(f"Std_{item}.notnull()")["Company"].values))
-    n_dlx = len(np.unique(session.sales_registry.get_quarter(session.quarter).query(f"Dlx_{item}.notnull()")["Company"].values))
-    
+    summary = session.sales_registry.get_market_summary(session.quarter)
+    n_std = summary.n_std_sellers[ITEM_INDEX[item]]
+    n_dlx = summary.n_dlx_sellers[ITEM_INDEX[item]]
 
     return n_std + parameter*n_dlx
 
@@ -73,58 +127,24 @@ def get_total_market_demand(session, item:str) -> np.ndarray:
     # TotMktDemand(perPA)=n*PlCap*MktClimateF*GradesSoldF*TotAdvF
     # Where GradesSoldF is : 
     # GradesSoldF=(∑_(i=0)^G▒〖(Y=1,N=0)*〖Demand〗_i 〗)/NumberGradesSold*(NumberGradesSold+1)/2
+    # NB : GradesSoldF is currently left out of the demand
 
-
-    PlCap = get_current_market_demand(session, item)
-    
-    n = get_num_sellers(session, item )
-    NgradesSold = session.sales_registry.get_n_grades_sold(session.quarter, item)
-    GradesSold = session.sales_registry.get_grades_sold(session.quarter, item)
-
-    MktClimateF = session.period_parameters.get_values(
-        'Market climate factor',
-        periods = [session.quarter]
-    )/100
-    # print(f"PlCap: {PlCap}")
-    # print(f"Number of sellers (n): {n}")
-    # print(f"Number of grades sold (NgradesSold): {NgradesSold}")
-    # print(f"Grades sold (GradesSold): {GradesSold}")
-    # print(f"Market climate factor (MktClimateF): {MktClimateF}")
-    per_grade_demands = []
-    for i in range(0,10):
-        if i in GradesSold:
-            grade_demand = session.period_parameters.get_values(
-                f'Product Cycle {item}{i}', 
-                session.quarter
-                )/100 #Percentage of item 0
-            per_grade_demands.append(grade_demand)
-    
-    AvgDemandInGradesSold =np.mean(per_grade_demands) if per_grade_demands else 0 # As a percentage of Item 0 demand
-    # print(f"Average demand in grades sold (AvgDemandInGradesSold): {AvgDemandInGradesSold}")
-
-    GradeSoldF = AvgDemandInGradesSold * (NgradesSold + 1)/2
-    # print(f"Grade Sold Factor (GradeSoldF): {GradeSoldF}")
-
-
-    totalAdvAmount = np.sum(session.sales_registry \
-                                .get_quarter(session.quarter)[f'Advertising_{item}'] \
-                                .values)
+    summary = session.sales_registry.get_market_summary(session.quarter)
+    PlCap = summary.market_potentials[ITEM_INDEX[item]]
+    n = get_num_sellers(session, item)
+    MktClimateF = summary.climate_factor
+    totalAdvAmount = summary.total_advertising[ITEM_INDEX[item]]
     #TODO : Move advertissement coeff to parameters sheet
     
     if n == 0 :
         return 0
     else :
         ADVERTISSEMENT_COEFF = 0.25 * (1/50000) * 1/n
-        # print(f"Advertisement Coefficient (ADVERTISSEMENT_COEFF): {ADVERTISSEMENT_COEFF}")
         TotAdvF = 1 + ADVERTISSEMENT_COEFF * totalAdvAmount if not np.isnan(totalAdvAmount) else 1
-        # print(f"Total advertisement amount: {totalAdvAmount}")
-        # print(f"Total advertisement factor: {TotAdvF}")
-        # print(f"Total Market Demand: {n * PlCap * MktClimateF * GradeSoldF * TotAdvF}")
 
         # return n * PlCap * MktClimateF * GradeSoldF * TotAdvF
         return n * PlCap * MktClimateF *  TotAdvF
 
-# def get_specific_market_demands(session, item:str, quarter:int) -> np.ndarray:
 def get_specific_market_demands(session, item:str) -> np.ndarray:
     """
     Computes the specific market for all grades of a given item.
@@ -135,37 +155,58 @@ def get_specific_market_demands(session, item:str) -> np.ndarray:
         a sparse array of shame [demandX0, demandX1, .... demand Xn]
     """
     global_market = get_total_market_demand(session, item)
-    # print("Calculating specific market demands...")
-    # print("Global market demand:", global_market)
-    # global_market = get_total_market_demand(session, item,  quarter)
-    attractivenesses = np.array([session.period_parameters.get_values(
-                        f'Product Cycle {item}{i}',
+    attractivenesses = session.period_parameters.get_quarter_values(
+                        [f'Product Cycle {item}{i}' for i in range(0,10)],
                         session.quarter
-                        # quarter
-                        ) for i in range(0,10)
-                        ])
-    # print("Attractivenesses:", attractivenesses)
-    n_sellers = np.array([len(np.unique(session.sales_registry \
-                 .get_quarter(session.quarter)\
-                 .query(f"Std_{item} == {i} or Dlx_{item} == {i}")["Company"]))
-
-                 for i in range(0,10)
-                    ])
-    # print("Number of sellers for each grade:", n_sellers)
-    a = [n_sellers[i]*attractivenesses[i] for i in range(0,10)]
-    # print("Intermediate calculation 'a':", a)
-    b = sum(n_sellers*attractivenesses)
-    # print("Intermediate calculation 'b':", b)
+                        )
+    n_sellers = session.sales_registry.get_market_summary(session.quarter).sellers_per_grade[ITEM_INDEX[item]]
+    a = n_sellers*attractivenesses
+    b = sum(a)
 
     # Handling a case with no seller
     if b >0 :
         specific_markets = (a/b * global_market).astype(int)
     else: 
         specific_markets =  np.zeros_like(a)
-    # print("Specific markets:", specific_markets)
 
     return np.array(specific_markets)
 
+def check_finite(values:np.ndarray, name:str) -> None:
+    """
+    Raises a ValueError naming the first market where `values` (of shape [...] or [..., company]) is NaN or infinite,
+    e.g when a parameter is missing for the quarter. Such values would otherwise be cast to arbitrary integer sales.
+    """
+    invalid = ~np.isfinite(values)
+    if invalid.any():
+        index = tuple(int(i) for i in np.argwhere(invalid)[0])
+        raise ValueError("Invalid {} {} in market {}. Check the parameters of the quarter.".format(name, values[index], index))
+
+def split_regional_demands(demands:np.ndarray, n_regions:int) -> np.ndarray:
+    """
+    Splits the demand of every market evenly across the regions, so that the total demand doesn't depend on the
+    number of regions (the Sales sheet and the market parameters carry no regional demand).
+
+    Whole units are split : the units left by the integer division go to the lowest regions.
+
+    Parameters
+    ----------
+    demands: np.ndarray
+        An array of shape [...] (e.g [item, grade]) giving the demand of each market.
+    n_regions: int
+        The number of regions.
+
+    Returns
+    -------
+    regional_demands: np.ndarray
+        An integer array of shape [region, ...] summing up to the floored demands along the region axis.
+    """
+    demands = np.asarray(demands, dtype=float)
+    check_finite(demands, 'demand')
+    demands = np.floor(demands).astype(np.int64)
+    shares, remainders = np.divmod(demands, n_regions)
+    regions = np.arange(n_regions).reshape((n_regions,) + (1,) * demands.ndim)
+    return shares + (regions < remainders)
+
 def get_companies_goodwill(session)-> dict:
     """
     Returns the goodwill index for each company under a dictionary.
@@ -182,58 +223,66 @@ def get_companies_goodwill(session)-> dict:
     return goodwills
 
 def get_specific_market_shares(session, item:str, grade:int) -> dict:
-    # Needs : goodwill, price difference wrt others, optimal_price_distance
     """
     Retrieves the marketshare for all companies given an item and a grade
     Returns
     -------
     markeshares: dict
-        a dictionary of structure {Company_{id:02d}: int(marketshare)}
+        a dictionary of structure {Company_{id:02d}: float(marketshare)}
     
     """
+    shares = get_market_shares(session)[ITEM_INDEX[item], grade]
+    return {f"Company_{company.id:02d}": share for company, share in zip(session.marketPlayers, shares)}
 
-    marketShares = {}
-    for company in session.marketPlayers:
-        goodwillF = attr.get_goodwill_factor(company)
-        wholeSalerF = attr.get_wholesaler_factor(company, session.period_parameters.get_values('Wholesaler bonus', session.quarter))
-        priceDifferenceF = attr.get_price_change_factor(session, company.id, item, grade,
-                                                        session.period_parameters.get_values('Price change factor', session.quarter))
-        
-        priceDifferenceF = attr.get_price_change_factor(session, company.id, item, grade, priceDifferenceF)
-        # print(f"Price Difference Factor: {priceDifferenceF}")
-        priceOptimalityF = attr.get_price_optimality_factor(session, company.id, item, grade,
-                                                            session.period_parameters.get_values('Price optimality factor', session.quarter))
-       
-        # print(f"Priceoptimality Value: {priceOptimalityF}")
-        
-        priceCompetitivenessF = attr.get_price_competitiveness_factor(session, company.id, item, grade, 
-                                                                      session.period_parameters.get_values("Competitiveness factor", session.quarter))
-        
-        # print(f"Price Competitiveness Factor Value: {priceCompetitivenessF}")
-
-       
-
-        marketShares[f"Company_{company.id:02d}"] = goodwillF * wholeSalerF * priceDifferenceF *  priceOptimalityF * priceCompetitivenessF
-        # print(" marketShares",goodwillF * wholeSalerF * priceDifferenceF * priceOptimalityF * priceCompetitivenessF)
-    
-    # print("likelyhood_to_probabilities",likelyhood_to_probabilities(marketShares))
+def get_market_shares(session) -> np.ndarray:
+    """
+    Returns the marketshares for each item, grade and company.
 
-    return  likelyhood_to_probabilities(marketShares)
+    All the attractiveness factors (goodwill, wholesaler, price change, price optimality and price competitiveness)
+    are computed at once over [company, item, grade] arrays, then turned into probabilities along the company axis.
 
-def get_market_shares(session):
-    """
-    Returns the marketshares for each grade, item and company
+    Returns
+    -------
+    market_shares: np.ndarray
+        An array of shape [item, grade, company] where companies are in the order of session.marketPlayers.
+        Shares of a market sum up to 1, or are all zeros if no company is attractive in that market.
     """
-    market_shares_dict = {}
-    
-    for item in ('X', 'Y'):
-        market_shares_dict[item] = {}
-        # print(f"Calculating market shares for item {item}")
-        for grade in range(0,10):
-            market_shares_dict[item][grade] = get_specific_market_shares(session, item, grade)
-            # print(f"Market shares for item {item}, grade {grade}: {market_shares_dict[item][grade]}")
-
-    return market_shares_dict
+    quarter = session.quarter
+    posted_prices = session.sales_registry.get_posted_prices(quarter)
+    prices = posted_prices.prices
+
+    wholesaler_bonus, price_change_impact, price_optimality_impact, competitiveness_impact = \
+        session.period_parameters.get_quarter_values(
+            ['Wholesaler bonus', 'Price change factor', 'Price optimality factor', 'Competitiveness factor'],
+            quarter
+            )
+    assert 0 < price_optimality_impact, ValueError("Impact should be a positive float. Default : 1.")
+    assert 0 < competitiveness_impact, ValueError("Parameter `impact` should be a positive float. Default value: 1")
+
+    # Optimal prices of shape [item, grade] : base price times the grade cycle with respect to grade 0
+    base_prices = session.period_parameters.get_quarter_values([f'Optimum price {item}0' for item in ITEMS], quarter)
+    price_multipliers = session.period_parameters.get_quarter_values(
+        [f'Product Cycle {item}{grade}' for item in ITEMS for grade in range(N_GRADES)],
+        quarter
+        ).reshape(len(ITEMS), N_GRADES)
+    optimal_prices = base_prices[:, np.newaxis] * price_multipliers/100
+
+    # Company factors of shape [company, 1, 1]
+    goodwillF = np.array([attr.get_goodwill_factor(company) for company in session.marketPlayers], dtype=float)
+    wholeSalerF = np.array([attr.get_wholesaler_factor(company, wholesaler_bonus) for company in session.marketPlayers], dtype=float)
+    companyF = (goodwillF * wholeSalerF)[:, np.newaxis, np.newaxis]
+
+    # Price factors of shape [company, item, grade]
+    priceDifferenceF = attr.price_change_factors(posted_prices.previous, prices, quarter, price_change_impact)
+    priceOptimalityF = attr.price_optimality_factors(prices, optimal_prices, price_optimality_impact)
+    priceCompetitivenessF = attr.price_competitiveness_factors(prices, posted_prices.average, competitiveness_impact)
+
+    likelyhoods = companyF * priceDifferenceF * priceOptimalityF * priceCompetitivenessF
+    likelyhoods = likelyhoods.transpose(1, 2, 0) # [item, grade, company]
+
+    # Normalising along the company axis
+    totals = likelyhoods.sum(axis=-1, keepdims=True)
+    return np.divide(likelyhoods, totals, out=np.zeros_like(likelyhoods), where=totals != 0)
 
 def run_sales_protocol(inventories:np.ndarray, specific_market_shares:np.ndarray, specific_grade_demand:int):
     """
@@ -257,53 +306,89 @@ def run_sales_protocol(inventories:np.ndarray, specific_market_shares:np.ndarray
         --> specific_market_shares = [0, 4 000, 1 000, 0]
         --> I.e Company 1 sells 0 units of Y3s, Company 2 sells 10 000 units, Company 3 sells 8 000 and Company 4 sells 0
     """
-    specific_market_potential = specific_grade_demand * specific_market_shares
-    # print(f"Specific market potential: {specific_market_potential}")
+    return run_batched_sales_protocol(
+        np.asarray(inventories)[np.newaxis],
+        np.asarray(specific_market_shares)[np.newaxis],
+        np.array([specific_grade_demand])
+        )[0]
 
-    excess_indices = np.where(inventories < specific_market_potential)
-    # print(f"Excess indices: {excess_indices}")
-    shortage_indices = np.where(inventories > specific_market_potential)
-    # print(f"Shortage indices: {shortage_indices}")
+def run_batched_sales_protocol(inventories:np.ndarray, market_shares:np.ndarray, demands:np.ndarray) -> np.ndarray:
+    """
+    Runs the sales protocol on any number of markets at once (e.g every item and grade).
 
-    excess_units = np.sum((specific_market_potential - inventories)[excess_indices])
-    # print(f"Excess units: {excess_units}")
-    
-    if not np.any(shortage_indices):
-        # print("No shortages detected.")
-        # Remove all excesses ; and quit
-        specific_market_potential = np.where(specific_market_potential < inventories, specific_market_potential, inventories)
-        # print("Shortages detected.")
-    else : 
-        shortage_units = np.sum((inventories - specific_market_potential)[shortage_indices])
-        # print(f"Shortage units: {shortage_units}")
-        remaining_units = min(excess_units, shortage_units)
-        # print(f"Remaining units: {remaining_units}")
-
-        new_specific_market_shares = np.zeros_like(specific_market_shares)
-        new_specific_market_shares[shortage_indices] = specific_market_shares[shortage_indices]
-        # print("new_specific_market_shares",new_specific_market_shares)
-
-        # Normalize new_specific_market_shares to probabilities
-        total_new_market_shares = np.sum(new_specific_market_shares)
-        if total_new_market_shares > 0:
-            new_specific_market_shares /= total_new_market_shares
-
-        new_market_potential = remaining_units * new_specific_market_shares
-        # if  total_new_market_shares > 0:
-        #     new_market_potential = specific_grade_demand * (specific_market_shares /  total_new_market_shares)
-        # else:
-        #     new_market_potential = np.zeros_like(specific_market_shares)
-
-        # print(f"New market potential: {new_market_potential}")
-
-        specific_market_potential = np.where(specific_market_potential < inventories, specific_market_potential, inventories)
-        specific_market_potential += new_market_potential
-        # print(f" specific_market_potential at the end: {new_market_potential}")
-
-       
-    # print("Calculation complete.")
-
-    return np.array(specific_market_potential, dtype=int)
+    In each market, the demand is water-filled : every company sells min(inventory, level * market_share),
+    where the level is the single value for which the total sales equal min(demand, total inventory).
+    Companies that run out of inventory therefore hand their remaining demand to the others, in proportion
+    to their shares, until the demand or the inventories are exhausted. The level is found with one sorted
+    pass over the companies, and sales are rounded to integers without losing or creating any unit.
+
+    Parameters
+    ----------
+    inventories: np.ndarray
+        An array of shape [..., company] giving the number of items available in each company's inventory
+    market_shares: np.ndarray
+        An array of shape [..., company] of probabilities of reaching a consumer in each market.
+        Negative shares (e.g from a negative price optimality factor) are treated as 0.
+    demands: np.ndarray
+        An array of shape [...] giving the gross demand of each market
+
+    Returns
+    -------
+    sales: np.ndarray
+        An integer array of shape [..., company] with the number of sales done by each company in each market.
+        Sales are never negative, never exceed inventories and sum up to min(demand, inventory of the companies
+        having a share). A market where no company has a positive share sells nothing.
+
+    Raises
+    ------
+    ValueError
+        If a market share or a demand is NaN or infinite.
+    """
+    market_shares = np.asarray(market_shares, dtype=float)
+    demands = np.asarray(demands, dtype=float)
+    check_finite(market_shares, 'market share')
+    check_finite(demands, 'demand')
+    # A negative share can't reach consumers : it would sell negative quantities and lower the level of the others
+    market_shares = np.maximum(market_shares, 0)
+    n_companies = market_shares.shape[-1]
+
+    # Only companies with a share can sell, and at most their (whole and non negative) inventory
+    capacities = np.where(market_shares > 0, np.maximum(np.floor(inventories), 0), 0).astype(np.int64)
+    total_sales = np.minimum(np.floor(demands).astype(np.int64), capacities.sum(axis=-1))
+    # Markets without any positive share sell nothing
+    total_sales = np.where(market_shares.sum(axis=-1) > 0, total_sales, 0)
+
+    # Level at which each company runs out of inventory, sorted in ascending order
+    with np.errstate(divide='ignore', invalid='ignore'):
+        levels = np.where(market_shares > 0, capacities / market_shares, 0)
+    order = np.argsort(levels, axis=-1, kind='stable')
+    sorted_levels = np.take_along_axis(levels, order, axis=-1)
+    cum_capacities = np.cumsum(np.take_along_axis(capacities, order, axis=-1), axis=-1)
+    cum_shares = np.cumsum(np.take_along_axis(market_shares, order, axis=-1), axis=-1)
+    total_shares = cum_shares[..., -1:]
+
+    # Sales reached at each sorted level : companies up to that level sell out, the others sell level * share
+    reached = cum_capacities + sorted_levels * (total_shares - cum_shares)
+    first = np.argmax(reached >= total_sales[..., np.newaxis], axis=-1)[..., np.newaxis]
+    # Companies before `first` are sold out, the level is set so that the others sell the remaining units
+    sold_out_capacities = np.where(first > 0, np.take_along_axis(cum_capacities, np.maximum(first - 1, 0), axis=-1), 0)
+    sold_out_shares = np.where(first > 0, np.take_along_axis(cum_shares, np.maximum(first - 1, 0), axis=-1), 0)
+    remaining_shares = total_shares - sold_out_shares
+    with np.errstate(divide='ignore', invalid='ignore'):
+        level = np.where(remaining_shares > 0, (total_sales[..., np.newaxis] - sold_out_capacities) / remaining_shares, 0)
+
+    sales = np.minimum(capacities, level * market_shares)
+
+    # Integer rounding : the units lost by flooring go to the largest remainders (ties to the lowest index)
+    floored = np.minimum(np.floor(sales).astype(np.int64), capacities)
+    missing_units = total_sales - floored.sum(axis=-1)
+    eligible = floored < capacities
+    remainders = np.where(eligible, sales - floored, -1)
+    ranks = np.empty_like(floored)
+    np.put_along_axis(ranks, np.argsort(-remainders, axis=-1, kind='stable'),
+                      np.broadcast_to(np.arange(n_companies), ranks.shape), axis=-1)
+    floored += eligible & (ranks < missing_units[..., np.newaxis])
+    return floored
  
 #########
 #Helpers#
@@ -1,5 +1,7 @@
 import numpy as np
 
+from salesHelpers.prices import ITEM_INDEX
+
 def get_goodwill_factor(company):
     """"""
     return company.goodwill 
@@ -31,27 +33,11 @@ def get_price_competitiveness_factor(session, cid:int, item:str, grade:int, impa
     
     assert 0<impact , ValueError("Parameter `impact` should be a positive float. Default value: 1")
 
-    registry = session.sales_registry.get_quarter(session.quarter)
-
-    # Retrieve matching posted prices in both standards
-    prices_for_standards = []
-    for standard in ("Std", "Dlx"):
-        prices_for_standards.append(registry.query(f"{standard}_{item} == {grade}")[f"Price_{standard}_{item}"].values)
-
-    # Retrieve own price
-    own_price = get_written_price(session, cid, item, grade)
-    if own_price == 0 : return 0
-    
-    # Compute average
-    avg_price = np.average(np.concatenate(prices_for_standards))
+    posted_prices = session.sales_registry.get_posted_prices(session.quarter)
 
-    # Compute factor
-    sig = sigmoid((avg_price - own_price)/avg_price)
-    redressed_sigmoid = sig - 0.5
-    res =  1 + impact * redressed_sigmoid
-    if res[0] == None:
-        return 0
-    return res
+    own_price = posted_prices.prices[cid - 1, ITEM_INDEX[item], grade]
+    avg_price = posted_prices.average[ITEM_INDEX[item], grade]
+    return price_competitiveness_factors(own_price, avg_price, impact)[()]
 
 def get_price_optimality_factor(session, cid:int, item:str, grade:int, impact:float=1) -> float:
     """ Returns the price optimality factor : translates how close the price is to the optimal price with respect to the product cycle and base brice.
@@ -71,14 +57,13 @@ def get_price_optimality_factor(session, cid:int, item:str, grade:int, impact:fl
     
     assert 0< impact, ValueError("Impact should be a positive float. Default : 1.")
 
-    base_price = session.period_parameters.get_values(f"Optimum price {item}0", [session.quarter])
-    price_multiplier = session.period_parameters.get_values(f"Product Cycle {item}{grade}", [session.quarter]) # From the grade cycle with respect to grade 0
+    # The multiplier is taken from the grade cycle with respect to grade 0
+    base_price, price_multiplier = session.period_parameters.get_quarter_values(
+        [f"Optimum price {item}0", f"Product Cycle {item}{grade}"], session.quarter)
     optimal_price = base_price * price_multiplier/100
 
     written_price = get_written_price(session, cid, item, grade)
-    price_difference = abs(written_price - optimal_price) / optimal_price
-
-    return 1 - impact * price_difference
+    return price_optimality_factors(written_price, optimal_price, impact)[()]
 
 def get_price_change_factor(session, cid:int ,item:str, grade:int, impact:float) -> float:
     """
@@ -100,18 +85,59 @@ def get_price_change_factor(session, cid:int ,item:str, grade:int, impact:float)
         A positive number related to how impactful is the price change on the final factor.
     """
 
-    # If only 1 or no quarter have elapsed, it is impossible to compute the difference
-    if session.quarter <= 2:
-        return 1
     # Retrieve both prices
-    previous_price = get_written_price(session, cid, item, grade, session.quarter -1)
-    current_price = get_written_price(session, cid, item, grade, session.quarter)
+    posted_prices = session.sales_registry.get_posted_prices(session.quarter)
+    previous_price = posted_prices.previous[cid - 1, ITEM_INDEX[item], grade]
+    current_price = posted_prices.prices[cid - 1, ITEM_INDEX[item], grade]
+    return price_change_factors(previous_price, current_price, session.quarter, impact)[()]
+
+##################
+# Batched factors#
+##################
+# The functions below compute a factor for whole arrays of prices at once (e.g [company, item, grade]).
+# Their inputs are broadcast together, so that per-grade parameters can be given as [item, grade] arrays.
+
+def price_competitiveness_factors(own_prices:np.ndarray, avg_prices:np.ndarray, impact = 1) -> np.ndarray:
+    """
+    Batched price competitiveness factor.
 
-    if previous_price == 0 or current_price == 0:
-        return 1
-    
-    else:
-        return 1 - impact * abs(previous_price - current_price)/100
+    Returns
+    -------
+    factors: np.ndarray
+        1 + impact * (sigmoid((avg_price - own_price) / avg_price) - 0.5) ; 0 where the own price is not posted.
+    """
+    own_prices = np.asarray(own_prices, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sig = sigmoid((avg_prices - own_prices)/avg_prices)
+    return np.where(own_prices == 0, 0, 1 + impact * (sig - 0.5))
+
+def price_optimality_factors(written_prices:np.ndarray, optimal_prices:np.ndarray, impact:float = 1) -> np.ndarray:
+    """
+    Batched price optimality factor.
+
+    Returns
+    -------
+    factors: np.ndarray
+        1 - impact * |written_price - optimal_price| / optimal_price
+    """
+    price_difference = np.abs(written_prices - optimal_prices) / optimal_prices
+    return np.asarray(1 - impact * price_difference)
+
+def price_change_factors(previous_prices:np.ndarray, current_prices:np.ndarray, quarter:int, impact) -> np.ndarray:
+    """
+    Batched price change factor.
+
+    Returns
+    -------
+    factors: np.ndarray
+        1 - impact * |previous_price - current_price| / 100 ; 1 where either price is not posted, 
+        and everywhere if only 1 or no quarter have elapsed.
+    """
+    previous_prices, current_prices = np.broadcast_arrays(previous_prices, current_prices)
+    if quarter <= 2:
+        return np.ones(previous_prices.shape)
+    not_posted = (previous_prices == 0) | (current_prices == 0)
+    return np.where(not_posted, 1, 1 - impact * np.abs(previous_prices - current_prices)/100)
 
 #########
 # Helper#
@@ -124,22 +150,12 @@ def get_written_price(session, cid:int, item:str, grade:int, quarter:int = None)
     Returns
     -------
     price_posted: int
-        The price posted by the company for the specified item in the current quarter
+        The price posted by the company for the specified item in the requested quarter (0 if none)
     """
     if quarter == None :
        quarter = session.quarter
 
-    current_registry = session.sales_registry.get_quarter(session.quarter)
-    # Attempt to retrieve price from Std
-    price_posted = current_registry.query(f"Std_{item} == {grade} and Company == {cid}")[f"Price_Std_{item}"].values.astype(int)
-    # If not found, retrieve from Dlx
-    if not any(price_posted):
-        price_posted = current_registry.query(f"Dlx_{item} == {grade} and Company == {cid}")[f"Price_Dlx_{item}"].values.astype(int)
-
-    if not any(price_posted):
-        price_posted = np.array(0)
-
-    return price_posted
+    return session.sales_registry.get_posted_prices(quarter).prices[cid - 1, ITEM_INDEX[item], grade]
 
 def sigmoid(x):
     return 1.0 / (1 + np.exp(-x))
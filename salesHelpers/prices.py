@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+ITEMS = ('X', 'Y')
+ITEM_INDEX = {item: index for index, item in enumerate(ITEMS)}
+N_GRADES = 10
+
+class PostedPrices:
+    """
+    The prices posted in the Sales sheet for one quarter, compiled into dense arrays.
+
+    Companies are indexed by `company id - 1`, items by ITEM_INDEX and grades by their value.
+
+    Attributes
+    ----------
+    prices: np.ndarray
+        int array of shape [company, item, grade]. The price posted by the company, 0 if it doesn't sell that grade.
+        The Std price is used when the company posts the grade in both standards.
+    is_deluxe: np.ndarray
+        bool array of shape [company, item, grade]. True where the price comes from the Dlx columns.
+    previous: np.ndarray
+        int array of shape [company, item, grade]. The prices posted in the previous quarter (0 if none).
+    average: np.ndarray
+        float array of shape [item, grade]. The average of all prices posted for the grade, in both standards.
+        NaN where nobody posts the grade.
+    """
+    def __init__(self, prices:np.ndarray, is_deluxe:np.ndarray, previous:np.ndarray, average:np.ndarray) -> None:
+        self.prices = prices
+        self.is_deluxe = is_deluxe
+        self.previous = previous
+        self.average = average
+
+def compile_posted_prices(sales:pd.DataFrame, n_companies:int) -> tuple:
+    """
+    Compiles the Sales rows of one quarter into dense price arrays.
+
+    Parameters
+    ----------
+    sales: pd.DataFrame
+        The Sales rows of the quarter.
+    n_companies: int
+        The number of companies, i.e the size of the company axis.
+
+    Returns
+    -------
+    (prices, is_deluxe, average): tuple
+        The arrays described in PostedPrices.
+    """
+    prices = np.zeros((n_companies, len(ITEMS), N_GRADES), dtype=np.int64)
+    is_deluxe = np.zeros((n_companies, len(ITEMS), N_GRADES), dtype=bool)
+    average = np.full((len(ITEMS), N_GRADES), np.nan)
+    companies = pd.to_numeric(sales['Company'], errors='coerce').to_numpy(dtype=float)
+
+    for item, i in ITEM_INDEX.items():
+        price_sums = np.zeros(N_GRADES)
+        price_counts = np.zeros(N_GRADES)
+        # Dlx is written first so that Std prices take priority where both are posted
+        for standard in ('Dlx', 'Std'):
+            grades = pd.to_numeric(sales[f'{standard}_{item}'], errors='coerce').to_numpy(dtype=float)
+            posted = pd.to_numeric(sales[f'Price_{standard}_{item}'], errors='coerce').to_numpy(dtype=float)
+            valid = ~np.isnan(grades) & (grades >= 0) & (grades < N_GRADES)
+            price_sums += np.bincount(grades[valid].astype(int), weights=posted[valid], minlength=N_GRADES)
+            price_counts += np.bincount(grades[valid].astype(int), minlength=N_GRADES)
+
+            valid &= ~np.isnan(companies) & (companies >= 1) & (companies <= n_companies) & ~np.isnan(posted)
+            rows = np.flatnonzero(valid)
+            # A price truncated to 0 counts as not posted. Rows are reversed so that the first row posted
+            # by a company wins, as a lookup would return it
+            rows = rows[posted[rows].astype(int) != 0][::-1]
+            company_index = companies[rows].astype(int) - 1
+            grade_index = grades[rows].astype(int)
+            prices[company_index, i, grade_index] = posted[rows].astype(int)
+            is_deluxe[company_index, i, grade_index] = standard == 'Dlx'
+
+        np.divide(price_sums, price_counts, out=average[i], where=price_counts > 0)
+
+    return prices, is_deluxe, average
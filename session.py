@@ -6,7 +6,10 @@ from sessionDatas import session_data_initializer
 from RD import RD_round
 import warnings
 from exporter import export_data
-from sales import get_market_shares, get_specific_market_demands, run_sales_protocol
+from sales import get_market_shares, get_specific_market_demands, run_batched_sales_protocol, split_regional_demands
+from salesHelpers.prices import ITEMS
+from production import ProductionLog
+from factories import MAX_FACTORIES
 import argparse
 
 class Session :
@@ -18,20 +21,33 @@ class Session :
     data_path\n
     n_companies\n
     n_quarters\n
-    n_regions\n
+    n_regions (the number of regions, 1 unless given, at most the number of areas of the transfer grid)\n
     period_parameters\n
     compatibilityGrid\n
     transferCosts\n
     transactions\n
     marketPlayers\n
-    quarter (the current quarter)
+    b2b_volumes (the volumes sold and bought in the current quarter, [side, mode, company, region, item, grade])\n
+    expedition_shortfall (the quantities missing at expedition this quarter, [mode, company, region, item, grade])\n
+    quarter (the current quarter)\n
+    production_log (the ProductionLog recording the X used by Y production, off by default)\n
+    n_factory_slots (the maximum number of factories per item and company)
     """
-    def __init__(self, data_path:os.PathLike) -> None:
+    def __init__(self, data_path:os.PathLike, use_cache:bool = True,
+                 production_log_level:int = ProductionLog.OFF, n_factory_slots:int = MAX_FACTORIES, n_regions:int = 1) -> None:
         self.data_path = data_path
         # Loads all the data from the global parameters sheet
         self.params_path = os.path.join(self.data_path, "Data.xlsx")
+        # Parsed sheets are reused from a binary cache while Data.xlsx is unchanged
+        self.use_cache = use_cache
+        self.production_log = ProductionLog(production_log_level)
+        self.n_factory_slots = n_factory_slots
+        # Regions found in the decisions above n_regions are rejected when the data is loaded
+        self.n_regions = n_regions
         # Inits the session data
         self = session_data_initializer(self)
+        # Quantities missing from the inventories at expedition, of shape [mode (Air, Surface), company, region, item, grade]
+        self.expedition_shortfall = np.zeros((len(freight.MODES),) + self.marketPlayers.get_inventory_array().shape, dtype=np.int64)
         self.quarter = 1
         pass
 
@@ -54,6 +70,8 @@ class Session :
         """
 
         self.transactions.update()
+        # The quarter's B2B volumes are aggregated once, then shared by freight and the exporter
+        self.b2b_volumes = freight.get_b2b_volumes(self)
 
         # Gathering begining inventory
         self.expedite()
@@ -96,62 +114,50 @@ class Session :
             self.runQuarter()
     
     def sales(self):
-        market_shares = get_market_shares(self)
-        # For each item X and Y
-        # iterate over the 10 grades
-        #   Give the mkt_share * gross demand for each
-            # Then, iterate until there is no more shortage or excess given theinventory
-        for company in self.marketPlayers:
-            company.sales_inventory.reset()
-
-        for item in ('X', 'Y'):
-
-            specMktGD = get_specific_market_demands(self, item)
-            # print("specMktGD", specMktGD)
-            for grade in range(0,10):
-                grade_demand = specMktGD[grade]
-                # print("grade_demand ", grade_demand )
-                # For all companies, inventory of the requested item
-                inventories = np.array(list(self.marketPlayers.get_inventories(item, grade).values()))
-                specific_market_shares = np.array(list(market_shares[item][grade].values())).flatten()
-                # print("specific_market_shares", specific_market_shares)
-
-                number_of_sales = run_sales_protocol(inventories, specific_market_shares, grade_demand)
-                # Updating the inventories
-                for company in self.marketPlayers:
-                    sales_qty = int(number_of_sales[company.id -1])
-                    # print("sales_qty", sales_qty)
-                    # print("#################")
-                    # print(company.id, company)
-                    company.inventory.remove(item, grade, sales_qty)
-                    # print(company.id, company)
-                    company.sales_inventory.add(item, grade, sales_qty)
-                pass
+        """
+        Runs the sales protocol on every region, item and grade market at once, then applies the resulting sales
+        to the main and sales inventories of all companies.
+        Sales decisions and market parameters aren't regional : every region is served by the inventories held in it,
+        with the same market shares, and the demand of every market is split evenly across the regions
+        (see `split_regional_demands`), so that the total demand doesn't depend on the number of regions.
+        """
+        inventories = self.marketPlayers.get_inventory_array().transpose(1, 2, 3, 0) # [region, item, grade, company]
+        market_shares = np.broadcast_to(get_market_shares(self), inventories.shape) # [item, grade, company] for every region
+        demands = np.array([get_specific_market_demands(self, item) for item in ITEMS]) # [item, grade]
+        demands = split_regional_demands(demands, self.n_regions) # [region, item, grade]
+
+        number_of_sales = run_batched_sales_protocol(inventories, market_shares, demands).transpose(3, 0, 1, 2)
+
+        # Updating the inventories of all companies at once
+        self.marketPlayers.get_inventory_array('main')[:] -= number_of_sales
+        self.marketPlayers.get_inventory_array('sales')[:] = number_of_sales
 
     def expedite(self):
-        """Expedites inventories Air and Surface, and recieves from Air."""
+        """
+        Expedites inventories Air and Surface, and recieves from Air.
+        Missing quantities are repaired and accumulated into `expedition_shortfall` for the quarter.
+        """
+        self.expedition_shortfall.fill(0)
         freight.airfreight_out(self)
-        risks_air = freight.risk_expediting(self)
+        freight.risk_expediting(self, 'Air')
         freight.airfreight_in(self)
         # this is added to do downgrading after freight_in
+        # Sales and production must see downgraded inventories : this downgrade can't be merged with the one after surface_in
         self.downgrade()
         freight.surface_out(self)
-        risks_surface = freight.risk_expediting(self)
-        self.expedition_risks = {"Surface": risks_surface, "Air":risks_air}
+        freight.risk_expediting(self, 'Surface')
 
     def downgrade(self):
-        """Applies downgrading to all marketplayers."""
-        for company in self.marketPlayers:
-            company.inventory.downgrade()
+        """Applies downgrading to the main inventories of all marketplayers at once."""
+        self.marketPlayers.downgrade()
 
     def run_production(self) -> None:
         """
-        Iterates over all company and calls 'Company.produce()' on each of them.\n
+        Processes the production decisions of all companies through 'MarketPlayers.produce()'.\n
         Inventories are updated and stored into company.prod_inventory
         """
-        for company in self.marketPlayers:
-            decisions = self.production_decisions.get_current_registry(self.quarter)
-            company.produce(decisions, self.compatibilityGrid, self.period_parameters, self.quarter)
+        self.marketPlayers.produce(self.production_decisions, self.compatibilityGrid, self.period_parameters, self.quarter,
+                                   log=self.production_log)
         # # add it
         # for company in self.marketPlayers:
         #      company.merge_inventories(reset=False)
@@ -172,13 +178,14 @@ class Session :
         self.marketPlayers.increment_factories_age(self.period_parameters)
 
         # Processing plant acquisitions & removals
-        plants_df = self.acquisitions.query(f"Type in ('X','Y') and Quarter == {self.quarter}")
+        acquisitions = self.acquisitions.get_quarter(self.quarter)
+        plants_df = acquisitions[acquisitions["Type"].isin(('X', 'Y'))]
         for _, row in plants_df.iterrows():
             company = row["Company"] - 1
             self.marketPlayers[company].factories.add_from_df(row, self.period_parameters, self.quarter)
 
         # Processing sales offices acquisitions & removals
-        salesOffices_df = self.acquisitions.get_quarter(self.quarter).query(f"Type == 'SO' and Quarter == {self.quarter}")
+        salesOffices_df = acquisitions[acquisitions["Type"] == 'SO']
         for _, row in salesOffices_df.iterrows():
             company = row["Company"] - 1
             self.marketPlayers[company].process_SO_acquistion(row)
@@ -186,13 +193,19 @@ class Session :
         # Processing statute changes for companies
         self.marketPlayers.update_wholesaling_status(quarter = self.quarter, registry = self.wholesaler_registry)
 
-        # Merging production inventories with main inventories
-        for company in self.marketPlayers : 
-            company.merge_inventories(reset=False)
+        # Merging production inventories with main inventories (in place, for all companies at once)
+        self.marketPlayers.merge_inventories(reset=False)
 
         # # Downgrading all inventories
         # self.downgrade()
 
+    def export_production_log(self, path:os.PathLike) -> None:
+        """Exports the production log to `path`, as parquet if its extension is .parquet and as csv otherwise."""
+        if str(path).endswith('.parquet'):
+            self.production_log.to_parquet(path)
+        else:
+            self.production_log.to_csv(path)
+
     def write_output(self,company):
         """DEBUG function -> Writes summarized inventory output into Data/output.txt"""
         filepath = os.path.join(self.data_path, "output.txt")
@@ -216,12 +229,25 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Runs a simulation given a path and a number of quarters")
     parser.add_argument('--n_quarters', '-n', type=int, default=5, help="Number of sessions to run.")
     parser.add_argument('--path', '-p', type=str, default=default_path, help="Path to the working folder")
+    parser.add_argument('--no-cache', action='store_true', help="Always parse Data.xlsx instead of using its binary cache.")
+    parser.add_argument('--production-log-level', type=int, default=ProductionLog.OFF, choices=[ProductionLog.OFF, ProductionLog.RECORD, ProductionLog.PRINT],
+                        help="0: no production log, 1: record the X used by Y production, 2: also print it.")
+    parser.add_argument('--factory-slots', type=int, default=MAX_FACTORIES, help="Maximum number of factories per item and company.")
+    parser.add_argument('--regions', type=int, default=1, help="Number of regions, up to the 3 areas of the transfer grid.")
+    parser.add_argument('--production-log', type=str, default=None, help="Exports the production log to this csv or parquet file (records it if the level is 0).")
 
     args = parser.parse_args()
 
     print(args.path)
 
-    S = Session(args.path)
+    log_level = args.production_log_level
+    if args.production_log is not None:
+        log_level = max(log_level, ProductionLog.RECORD)
+
+    S = Session(args.path, use_cache=not args.no_cache, production_log_level=log_level,
+                n_factory_slots=args.factory_slots, n_regions=args.regions)
     S.runSessions(args.n_quarters)
+    if args.production_log is not None:
+        S.export_production_log(args.production_log)
 
     pass
\ No newline at end of file
@@ -1,19 +1,24 @@
 import numpy as np
 import pandas as pd
 import os
+import io
+import hashlib
+import json
 
-from transactions import TransactionRegistry
+from registry import Registry
+from transactions import TransactionRegistry, MODES, MODE_INDEX
 from production import ProductionRegistry
 from sales import SalesRegistry
 import companies
 import RD
+from salesHelpers.prices import ITEMS, ITEM_INDEX
 
 def session_data_initializer(session):
     """
     Takes a session and initialises the following attributes : 
     - `n_companies`
     - `n_quarters`
-    - `n_regions`
+    - `n_regions`             (checked against the transfer areas and the regions of the decisions)
     - `period_parameters`
     - `compatibilityGrid`     (for production of Y given X grade)
     - `transferCosts`         (transfer costs across regions)
@@ -24,30 +29,160 @@ def session_data_initializer(session):
     - `sales_registry`        (B2C sales decisions registry)
     - `biddings`              (biddings for R&D)
     """
-    file_path = session.params_path
-    parameters_df = pd.read_excel(file_path, sheet_name='Parameters')
-    session.n_regions = 1 # TODO: Hardcoded n_regions must be changed to dynamic
-    assert session.n_regions == 1, NotImplementedError("Only one region is supported so far but n_regions = {} was given.".format(session.n_regions))
+    sheets = load_workbook_sheets(session.params_path, use_cache=session.use_cache)
+    if not 1 <= session.n_regions <= TransferCostGrid.N_AREAS:
+        raise ValueError("The transfer grid has {} areas, but n_regions = {} was given.".format(TransferCostGrid.N_AREAS, session.n_regions))
+    check_regions(sheets, session.n_regions)
 
-    # TODO : Change import to single xlsx sheet
-    session.period_parameters = PeriodParameters(parameters_df)
-    session.compatibilityGrid = CompatibilityGrid(pd.read_excel(file_path, sheet_name='Compatibility Grid', skiprows=[0,1], usecols='C:L'))
-    # session.transfercosts = TransferCostGrid(pd.read_excel(file_path, sheet_name='Transfers')) # TODO : Update this and subsequent functions
+    session.period_parameters = PeriodParameters(sheets['Parameters'])
+    session.compatibilityGrid = CompatibilityGrid(sheets['Compatibility Grid'])
+    session.transferCosts = TransferCostGrid(*split_transfers_sheet(sheets['Transfers']))
 
     # Setting up the companies
-    # TODO : Consider not reusing twice the same pd.read_excel command below : 
-    session.marketPlayers = companies.MarketPlayers(pd.read_excel(file_path, sheet_name='Companies'))
-    session.wholesaler_registry =  WholesalerRegistry(pd.read_excel(file_path, sheet_name='Companies'))
+    session.marketPlayers = companies.MarketPlayers(sheets['Companies'], n_factory_slots = session.n_factory_slots, n_regions = session.n_regions)
+    session.wholesaler_registry =  WholesalerRegistry(sheets['Companies'])
 
     # Gathering decisions
-    session.transactions =          TransactionRegistry(path = file_path) # B2B items transactions
-    session.acquisitions =          AcquisitionsRegistry(pd.read_excel(file_path, sheet_name='Acquisitions')) # Factories & SO
-    session.production_decisions =  ProductionRegistry(file_path)
-    session.sales_registry =        SalesRegistry(pd.read_excel(file_path, sheet_name='Sales'))
-    session.biddings =              RD.Biddings(session)
+    session.transactions =          TransactionRegistry(path = session.params_path, data = sheets['B2B Transactions']) # B2B items transactions
+    session.acquisitions =          AcquisitionsRegistry(sheets['Acquisitions']) # Factories & SO
+    session.production_decisions =  ProductionRegistry(sheets['Production'])
+    session.sales_registry =        SalesRegistry(sheets['Sales'], n_companies = len(session.marketPlayers), period_parameters = session.period_parameters)
+    session.biddings =              RD.Biddings(sheets['R&D'])
     return session
 
-class AcquisitionsRegistry:
+# The columns holding a region, per sheet
+REGION_COLUMNS = {
+    'B2B Transactions': ('Selling Region', 'Buying Region'),
+    'Acquisitions':     ('Region',),
+    'Production':       ('Region',),
+}
+
+def check_regions(sheets:dict, n_regions:int) -> None:
+    """
+    Checks that every region found in the decision sheets is one of the `n_regions` regions of the session.
+    Missing regions are allowed. Raises a ValueError naming the first sheet row holding another region.
+    """
+    for sheet, columns in REGION_COLUMNS.items():
+        for column in columns:
+            regions = pd.to_numeric(sheets[sheet][column], errors='coerce')
+            invalid = regions.notna() & ((regions < 1) | (regions > n_regions))
+            if invalid.any():
+                row = invalid.idxmax()
+                # Sheet rows start at 2, below the header
+                raise ValueError("{} row {} has {} = {:g}, but the session has {} region(s). "
+                                 "Set n_regions (--regions) to play with more regions.".format(sheet, row + 2, column, regions[row], n_regions))
+
+# Sheets read from Data.xlsx and the keyword arguments passed to their parser.
+SHEETS = {
+    'Parameters':           {},
+    'Compatibility Grid':   {'skiprows': [0, 1], 'usecols': 'C:L'},
+    'Companies':            {},
+    'B2B Transactions':     {},
+    'Acquisitions':         {},
+    'Production':           {},
+    'Sales':                {},
+    'R&D':                  {},
+    'Transfers':            {'header': None},
+}
+
+def load_workbook_sheets(file_path:os.PathLike, sheets:dict = SHEETS, use_cache:bool = False) -> dict:
+    """
+    Reads the workbook once and parses all the requested sheets from that single read.
+
+    Parameters
+    ----------
+    file_path : os.PathLike
+        The path to the workbook (usually Data.xlsx).
+    sheets : dict
+        Maps each sheet name to the keyword arguments of its parser. Defaults to SHEETS.
+    use_cache : bool
+        If True, the parsed sheets are loaded from (or saved to) a binary cache next to the workbook, an .npz archive
+        of plain arrays read without pickle. The cache is only used while the workbook content is unchanged.
+
+    Returns
+    -------
+    dict
+        The parsed sheets as {sheet_name: pd.DataFrame}.
+    """
+    with open(file_path, 'rb') as f:
+        content = f.read()
+
+    if use_cache:
+        cache_path = get_cache_path(file_path)
+        # The key also covers the parser arguments, so that changing SHEETS invalidates the cache
+        key = hashlib.sha256(content + repr(sheets).encode()).hexdigest()
+        cached = _read_cache(cache_path, key)
+        if cached is not None:
+            return cached
+
+    parsed = _parse_sheets(content, sheets)
+
+    if use_cache:
+        _write_cache(cache_path, key, parsed)
+    return parsed
+
+def get_cache_path(file_path:os.PathLike) -> str:
+    """Returns the path of the binary cache stored next to the given workbook."""
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, f".{name}.cache.npz")
+
+def _read_cache(cache_path:str, key:str) -> dict:
+    """
+    Returns the cached sheets if the cache exists and matches the key, None otherwise.
+    The cache is loaded without pickle support, so that it holds data only (no code runs on load).
+    """
+    try:
+        with np.load(cache_path, allow_pickle=False) as cache:
+            if str(cache['key']) != key:
+                return None
+            return {name: _decode_sheet(cache, i) for i, name in enumerate(json.loads(str(cache['sheets'])))}
+    except Exception: # Missing, corrupted or written in another layout
+        return None
+
+def _write_cache(cache_path:str, key:str, sheets:dict) -> None:
+    """Saves the parsed sheets to the cache. A cache that cannot be written (or encoded) is simply skipped."""
+    arrays = {'key': np.array(key), 'sheets': np.array(json.dumps(list(sheets)))}
+    try:
+        for i, df in enumerate(sheets.values()):
+            arrays.update(_encode_sheet(df, i))
+        np.savez(cache_path, **arrays)
+    except (OSError, TypeError, ValueError):
+        pass
+
+def _encode_sheet(df:pd.DataFrame, i:int) -> dict:
+    """
+    Encodes a sheet into the arrays of the cache, one per column. Numeric, boolean and datetime columns are
+    stored as they are ; object columns (text, mixed values) are stored as the JSON text of every value.
+    """
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        raise ValueError("Only sheets with a default index are cached")
+    arrays = {f'sheet{i}_columns': np.array(json.dumps(df.columns.tolist()))}
+    for j, (_, column) in enumerate(df.items()):
+        if column.dtype == object:
+            arrays[f'sheet{i}_json{j}'] = np.array([json.dumps(value) for value in column.tolist()], dtype=str)
+        else:
+            arrays[f'sheet{i}_col{j}'] = column.to_numpy()
+    return arrays
+
+def _decode_sheet(cache, i:int) -> pd.DataFrame:
+    """Rebuilds the sheet stored by `_encode_sheet()`."""
+    columns = json.loads(str(cache[f'sheet{i}_columns']))
+    data = {}
+    for j in range(len(columns)):
+        if f'sheet{i}_json{j}' in cache:
+            data[j] = pd.Series([json.loads(value) for value in cache[f'sheet{i}_json{j}']], dtype=object)
+        else:
+            data[j] = cache[f'sheet{i}_col{j}']
+    df = pd.DataFrame(data)
+    df.columns = columns
+    return df
+
+def _parse_sheets(content:bytes, sheets:dict) -> dict:
+    """Opens the workbook content once and parses the given sheets."""
+    with pd.ExcelFile(io.BytesIO(content)) as workbook:
+        return {name: workbook.parse(name, **kwargs) for name, kwargs in sheets.items()}
+
+class AcquisitionsRegistry(Registry):
     """
     The registry of plant or sales offices acquisitions or sales for all quarters.
 
@@ -60,47 +195,12 @@ class AcquisitionsRegistry:
     -------
     get_quarter(quarter)
         Returns the acquisitions corresponding to the demanded quarter.
+    get_company(quarter, cid)
+        Returns the acquisitions of a company in the demanded quarter.
     query(*args, **kwargs)
         Calls the `query()` method on the registry data DataFrame.
     """
 
-    def __init__(self, df: pd.DataFrame) -> None:
-        self.data = df
-
-    def get_quarter(self, quarter: int) -> pd.DataFrame:
-        """
-        Returns the acquisitions corresponding to the demanded quarter.
-
-        Parameters
-        ----------
-        quarter : int
-            The demanded quarter (starts at 1).
-
-        Returns
-        -------
-        pd.DataFrame
-            The acquisitions DataFrame for the specified quarter.
-        """
-        return self.data.query(f"Quarter == {quarter}")
-
-    def query(self, *args, **kwargs) -> pd.DataFrame:
-        """
-        Calls the `query()` method on the registry data DataFrame.
-
-        Parameters
-        ----------
-        *args : tuple
-            Positional arguments to pass to the `query()` method.
-        **kwargs : dict
-            Keyword arguments to pass to the `query()` method.
-
-        Returns
-        -------
-        pd.DataFrame
-            The result of the query operation on the registry data DataFrame.
-        """
-        return self.data.query(*args, **kwargs)
-
 class CompatibilityGrid :
     """
     The grid containing the compatibility ratios between different grades of X and Y.
@@ -126,18 +226,35 @@ class TransferCostGrid:
     """
     The grid containing transfer costs for different items, sources, and destinations.
 
+    The grid is compiled into arrays of shape [mode (Air, Surface), item (X, Y), source area, destination area],
+    so that whole sets of transfers can be priced at once.
+
     Attributes
     ----------
     data : dict
         A dictionary containing transfer cost data for different types (AIRFREIGHT, SURFACE).
     discount_rate : dict
         A dictionary containing discount rates for different types (AIRFREIGHT, SURFACE).
+    prices : np.ndarray
+        float array of shape [mode, item, source, destination]. The unit price of the transfers (NaN if not in the grid).
+    thresholds : np.ndarray
+        float array of shape [mode, item, source, destination]. The volume past which the discount applies.
+    discounts : np.ndarray
+        float array of shape [mode]. The discount rate of each mode.
 
     Methods
     -------
     getTransferCost(item, source, destination, volume, type)
         Returns the total transfer cost based on the transfer cost grid.
+    get_transfer_costs(modes, items, sources, destinations, volumes)
+        Returns the total transfer costs of many transfers at once.
+    price_transactions(transactions)
+        Returns the transfer cost of every B2B transaction of a DataFrame.
     """
+    # The grid types, in the order of the transactions' transport modes
+    TYPES = {"AIRFREIGHT": 'Air', "SURFACE": 'Surface'}
+    # The number of areas (regions) the grid prices transfers between
+    N_AREAS = 3
 
     def __init__(self, df_air: pd.DataFrame, df_surface: pd.DataFrame) -> None:
         col_names = ["Item", "Source", "Area 1 price", "Area 2 price", "Area 3 price", "None", "Area 1 discount",
@@ -149,6 +266,23 @@ class TransferCostGrid:
             "AIRFREIGHT": df_air.loc[df_air['Item'].isin(['X', 'Y'])],
             "SURFACE": df_surface.loc[df_surface["Item"].isin(['X', 'Y'])]
         }
+        self._compile()
+
+    def _compile(self) -> None:
+        """Compiles the grid DataFrames into the price, threshold and discount arrays."""
+        n_areas = self.N_AREAS
+        shape = (len(MODES), len(ITEMS), n_areas, n_areas)
+        self.prices = np.full(shape, np.nan)
+        self.thresholds = np.full(shape, np.nan)
+        self.discounts = np.array([self.discount_rate[type_] for type_ in self.TYPES])
+
+        for type_, mode in self.TYPES.items():
+            data = self.data[type_]
+            sources = data["Source"].str.extract(r'(\d+)', expand=False).astype(int).to_numpy() - 1
+            items = data["Item"].map(ITEM_INDEX).to_numpy()
+            for destination in range(n_areas):
+                self.prices[MODE_INDEX[mode], items, sources, destination] = data[f"Area {destination + 1} price"].to_numpy(dtype=float)
+                self.thresholds[MODE_INDEX[mode], items, sources, destination] = data[f"Area {destination + 1} discount"].to_numpy(dtype=float)
 
     def getTransferCost(self, item: str, source: int, destination: int, volume: int, type: str) -> float:
         """
@@ -173,36 +307,105 @@ class TransferCostGrid:
             The total transfer cost.
         """
         assert item in ["X", "Y"], "Product type must be either X or Y but {} was given".format(item)
-        specific_data = self.data[type].loc[self.data[type]["Item"] == item]
-        specific_data = specific_data.loc[specific_data["Source"] == "FROM AREA {} TO".format(source)]
+        return self.get_transfer_costs(MODE_INDEX[self.TYPES[type]], ITEM_INDEX[item], source - 1, destination - 1, volume)[()]
 
-        threshold_volume = specific_data["Area {} discount".format(destination)].values
-        unit_price = specific_data["Area {} price".format(destination)].values
+    def get_transfer_costs(self, modes, items, sources, destinations, volumes) -> np.ndarray:
+        """
+        Returns the total transfer costs of many transfers at once. All arguments are broadcast together.
 
-        if volume <= threshold_volume:
-            price = volume * unit_price
-        else:
-            price = threshold_volume * unit_price
-            price += self.discount_rate[type] * (volume - threshold_volume) * unit_price
-        return price[0]
+        The unit price applies up to the threshold volume, and the discounted unit price past it.
+
+        Parameters
+        ----------
+        modes : array-like of int
+            The transport mode indices (see transactions.MODES).
+        items : array-like of int
+            The item indices (see ITEM_INDEX).
+        sources, destinations : array-like of int
+            The area indices of departure and destination (starting at 0).
+        volumes : array-like
+            The volumes of the transfers (actual number, not thousands).
+
+        Returns
+        -------
+        np.ndarray
+            The total transfer costs.
+        """
+        unit_prices = self.prices[modes, items, sources, destinations]
+        thresholds = self.thresholds[modes, items, sources, destinations]
+        volumes = np.asarray(volumes, dtype=float)
+        discounted_volumes = np.maximum(volumes - thresholds, 0)
+        return unit_prices * (np.minimum(volumes, thresholds) + self.discounts[modes] * discounted_volumes)
+
+    def price_transactions(self, transactions: pd.DataFrame) -> np.ndarray:
+        """
+        Returns the transfer cost of every B2B transaction of the DataFrame (NaN for transactions outside of the grid).
+        """
+        modes = transactions["Air / Surface"].map(MODE_INDEX).to_numpy(dtype=float)
+        items = transactions["Product"].map(ITEM_INDEX).to_numpy(dtype=float)
+        sources = pd.to_numeric(transactions["Selling Region"], errors='coerce').to_numpy(dtype=float) - 1
+        destinations = pd.to_numeric(transactions["Buying Region"], errors='coerce').to_numpy(dtype=float) - 1
+        volumes = pd.to_numeric(transactions["Volume"], errors='coerce').to_numpy(dtype=float)
+
+        n_areas = self.prices.shape[2]
+        valid = (~np.isnan(modes) & ~np.isnan(items) & (sources >= 0) & (sources < n_areas)
+                 & (destinations >= 0) & (destinations < n_areas))
+        costs = np.full(len(transactions), np.nan)
+        costs[valid] = self.get_transfer_costs(*(axis[valid].astype(int) for axis in (modes, items, sources, destinations)),
+                                               volumes[valid])
+        return costs
+
+def split_transfers_sheet(df: pd.DataFrame) -> tuple:
+    """
+    Splits the 'Transfers' sheet (read without header) into its AIRFREIGHT and SURFACE tables.
+
+    Each table starts below the row holding its type name, and holds the following X and Y rows.
+
+    Returns
+    -------
+    (df_air, df_surface): tuple
+        The two tables, with the 9 columns expected by TransferCostGrid.
+    """
+    tables = []
+    for type_ in TransferCostGrid.TYPES:
+        start = np.flatnonzero(df.iloc[:, 1].astype(str).str.strip() == type_)[0] + 1
+        rows = df.iloc[start:, :9]
+        n_rows = np.argmin(rows.iloc[:, 0].isin(ITEMS).to_numpy().tolist() + [False])
+        tables.append(rows.iloc[:n_rows])
+    return tuple(tables)
 
 class PeriodParameters:
     """
     The parameters for different periods.
 
+    The sheet is compiled once into a float64 matrix (one row per parameter, one column per period)
+    and an index from parameter names to rows, so that lookups don't scan the DataFrame.
+
     Attributes
     ----------
     data : pd.DataFrame
+    values : np.ndarray
+        The (read-only) matrix of parameter values, of shape [n_parameters, n_periods].
+    index : dict
+        Maps each parameter name to its row in `values`.
 
     Methods
     -------
     get_values(parameter, periods)
         Returns the values of the given parameter name.
+    get_quarter_values(parameters, quarter)
+        Returns the values of several parameters for one quarter.
     """
 
     def __init__(self, df: pd.DataFrame) -> None:
         df.rename(columns={df.columns[0]: "Parameter"}, inplace=True)
         self.data = df
+        self.values = df.iloc[:, 1:].to_numpy(dtype=np.float64)
+        self.values.setflags(write=False)
+        self.index = {}
+        for row, parameter in enumerate(df['Parameter']):
+            self.index.setdefault(parameter, row) # If a name is duplicated, its first row is used
+        self._rows_cache = {}
 
     def get_values(self, parameter: str, periods: list = None) -> np.ndarray:
         """
@@ -221,15 +424,41 @@ class PeriodParameters:
             The values of the parameter.
         """
         try:
-            values = self.data.loc[self.data['Parameter'] == parameter].values[0, 1:]
-        except:
-            raise KeyError("Parameter {} was not found in the period parameters.".format(parameter))
+            values = self.values[self.index[parameter]]
+        except KeyError:
+            raise KeyError("Parameter {} was not found in the period parameters.".format(parameter)) from None
         if periods is not None:
             periods = np.array(periods) - 1
             return values[periods]
         else:
             return values
-        
+
+    def get_quarter_values(self, parameters: list, quarter: int) -> np.ndarray:
+        """
+        Returns the values of several parameters for one quarter.
+
+        Parameters
+        ----------
+        parameters : list
+            The names of the parameters. Example: ['Wholesaler bonus', 'Price change factor'].
+        quarter : int
+            The quarter (starts at 1).
+
+        Returns
+        -------
+        np.ndarray
+            The values of the parameters for the quarter, in the order of `parameters`.
+        """
+        key = tuple(parameters)
+        rows = self._rows_cache.get(key)
+        if rows is None:
+            try:
+                rows = np.array([self.index[parameter] for parameter in key], dtype=int)
+            except KeyError as error:
+                raise KeyError("Parameter {} was not found in the period parameters.".format(error.args[0])) from None
+            self._rows_cache[key] = rows
+        return self.values[rows, quarter - 1]
+
 class WholesalerRegistry:
     def __init__(self, df:pd.DataFrame) -> 'WholesalerRegistry':
         """
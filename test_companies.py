@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+from companies import Company, Inventory, MarketPlayers
+
+
+def test_bulk_built_companies_match_single_ones():
+    companies_data = pd.DataFrame({'Id': [1, 2], 'Name': ['Chipsters', 'Compify']})
+    market = MarketPlayers(companies_data)
+    single = Company(companies_data.iloc[0])
+    for company in market:
+        for attribute in Company.__slots__:
+            assert hasattr(company, attribute), attribute
+            if attribute not in ('id', 'name', 'inventory', 'prod_inventory', 'sales_inventory', 'factories'):
+                assert getattr(company, attribute) == getattr(single, attribute), attribute
+    # Companies are views on their own row of the store
+    market[1].inventory.add('X', 3, 100)
+    assert market.get_inventory_array()[:, 0, 0, 3].tolist() == [0, 100]
+
+def test_downgrade_keeps_the_highest_grade_and_pools_the_others():
+    market = MarketPlayers(pd.DataFrame({'Id': [1, 2], 'Name': ['Chipsters', 'Compify']}))
+    inventories = market.get_inventory_array()
+    inventories[0, 0, 0, [4, 5, 6, 7]] = [10, 20, 30, 40]
+    # X holds two grades only : Y must still be downgraded (the per-company loop used to skip it)
+    inventories[1, 0, 0, [1, 2]] = [5, 6]
+    inventories[1, 0, 1, [0, 3, 8]] = [1, 2, 3]
+
+    market.downgrade()
+    assert inventories[0, 0, 0].tolist() == [0, 0, 0, 0, 60, 0, 0, 40, 0, 0]
+    assert inventories[1, 0, 0].tolist() == [0, 5, 6, 0, 0, 0, 0, 0, 0, 0]
+    assert inventories[1, 0, 1].tolist() == [3, 0, 0, 0, 0, 0, 0, 0, 3, 0]
+    assert inventories[0, 0, 1].sum() == 0
+
+def test_inventories_hold_whole_units():
+    market = MarketPlayers(pd.DataFrame({'Id': [1], 'Name': ['Chipsters']}))
+    inventory = market[0].inventory
+    assert market.get_inventory_array().dtype == np.int64
+    # Fractional quantities (e.g. the output of aged factories) are truncated, not carried as partial items
+    inventory.add('X', 2, 10.7)
+    inventory.add('X', 2, 0.9)
+    inventory.remove('X', 2, 3.5)
+    assert inventory.get('X')[2] == 7
+    assert inventory.get('X').dtype == np.int64
+
+def test_merge_keeps_the_regions():
+    inventory, other = Inventory(n_regions=3), Inventory(n_regions=3)
+    inventory.add('X', 4, 100, region=2)
+    other.add('X', 4, 50, region=2)
+    other.add('Y', 1, 7, region=3)
+
+    merged = inventory.merge(other)
+    assert merged.get('X', region=None).shape == (3, 10)
+    assert merged.get('X', region=2)[4] == 150 and merged.get('Y', region=3)[1] == 7
+    # The merged inventories are left untouched
+    assert inventory.get('X', region=2)[4] == 100 and inventory.get('Y', region=3).sum() == 0
+
+    inventory.merge(other, out=inventory)
+    assert (inventory.get('X', region=None) == merged.get('X', region=None)).all()
+
+def test_inventories_are_merged_in_place():
+    market = MarketPlayers(pd.DataFrame({'Id': [1, 2], 'Name': ['Chipsters', 'Compify']}))
+    store, company = market.store.data, market[1]
+    X = company.inventory.X
+    company.inventory.add('X', 2, 100)
+    company.prod_inventory.add('X', 2, 40)
+    company.prod_inventory.add('Y', 6, 7)
+
+    # The whole market : production is added to main in place, and kept when reset is False
+    market.merge_inventories(reset=False)
+    assert company.get_inventory('X')[2] == 140 and company.get_inventory('Y')[6] == 7
+    assert company.get_inventory('X', type_='production')[2] == 40
+    market.merge_inventories()
+    assert company.get_inventory('X')[2] == 180 and not market.get_inventory_array('production').any()
+
+    # A single company accumulates into its own views on the store
+    company.prod_inventory.add('Y', 6, 3)
+    company.merge_inventories()
+    assert company.get_inventory('Y')[6] == 17 and company.prod_inventory.get('Y').sum() == 0
+    # Nothing was reallocated : the store and the company views are the same arrays
+    assert market.store.data is store and company.inventory.X is X and np.shares_memory(X, store)
@@ -0,0 +1,29 @@
+import numpy as np
+
+from factories import Factories, Factory, FactoryFleet
+
+
+def test_capacities_follow_acquisitions_aging_and_removals():
+    fleet = FactoryFleet(2)
+    factories = Factories(fleet, 1)
+    # Capacities are a view on the fleet : acquisitions, aging and removals show through without fetching them again
+    capacities = factories.get_capacities('X')
+    assert np.shares_memory(capacities, fleet.max_output)
+    assert np.isnan(capacities).all()
+
+    factories.add(Factory.from_values(1, 'X', 0, 1000.0, 0.8))
+    factories.add(Factory.from_values(2, 'X', 0, 2000.0, 0.8))
+    assert capacities[:2].tolist() == [1000.0, 2000.0]
+    assert factories.get_factories_production('X') == [1000.0, 2000.0]
+    assert factories.get_regions('X').tolist() == [1, 2, 0]
+
+    fleet.increment_age(np.array([1, 0.5, 0.25]))
+    assert capacities[:2].tolist() == [500.0, 1000.0]
+    assert factories.get_factories_production('X') == [500.0, 1000.0]
+    assert factories.get_ages('X').tolist() == [1, 1]
+
+    factories.remove(1, 'X')
+    assert np.isnan(capacities[0]) and capacities[1] == 1000.0
+    assert factories.get_factories_production('X') == [1000.0]
+    # The other company and item are untouched
+    assert np.isnan(fleet.max_output[0]).all() and np.isnan(factories.get_capacities('Y')).all()
@@ -0,0 +1,39 @@
+import os
+import numpy as np
+
+import freight
+from session import Session
+from transactions import MODE_INDEX, SOLD, BOUGHT
+
+DATA_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_freight_applies_the_shared_b2b_volumes():
+    session = Session(DATA_PATH, use_cache=False)
+    session.b2b_volumes = np.zeros((2, 2) + session.marketPlayers.get_inventory_array().shape, dtype=np.int64)
+    session.b2b_volumes[SOLD, MODE_INDEX['Air'], 0, 0, 0, 3] = 500
+    session.b2b_volumes[BOUGHT, MODE_INDEX['Air'], 1, 0, 0, 3] = 500
+    inventories = session.marketPlayers.get_inventory_array()
+    inventories[0, 0, 0, 3] = 800
+
+    freight.airfreight_out(session)
+    freight.airfreight_in(session)
+    freight.surface_out(session)
+    assert inventories[0, 0, 0, 3] == 300
+    assert inventories[1, 0, 0, 3] == 500
+    assert inventories.sum() == 800
+
+def test_risk_expediting_repairs_and_reports_the_shortfall():
+    session = Session(DATA_PATH, use_cache=False)
+    inventories = session.marketPlayers.get_inventory_array()
+    inventories[2, 0, 1, 4] = -120
+    inventories[2, 0, 1, 5] = 60
+
+    freight.risk_expediting(session, 'Surface')
+    assert inventories[2, 0, 1].tolist()[4:6] == [0, 60]
+    assert session.expedition_shortfall[MODE_INDEX['Surface'], 2, 0, 1, 4] == 120
+    assert session.expedition_shortfall.sum() == 120
+    # Shortfalls of both expeditions accumulate for the quarter
+    inventories[2, 0, 1, 4] = -30
+    freight.risk_expediting(session, 'Surface')
+    assert session.expedition_shortfall[MODE_INDEX['Surface'], 2, 0, 1, 4] == 150
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pandas as pd
+
+from production import ProductionLog, produce_Y
+from session import Session
+from sessionDatas import CompatibilityGrid
+
+DATA_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_decisions(**columns) -> pd.DataFrame:
+    # Columns not given take the same value in every decision
+    n_decisions = max((len(values) for values in columns.values()), default=1)
+    defaults = {'Company': 1, 'Item': 'Y', 'Grade': 0, 'Volume': 1000, 'Preference': 1, 'Factory': 1, 'Standard': 'std'}
+    defaults.update(columns)
+    return pd.DataFrame(defaults, index=range(n_decisions))
+
+def test_produce_Y_accepts_fractional_ratios():
+    grid = CompatibilityGrid(pd.DataFrame(np.full((10, 10), 1.5)))
+    X_inventories = np.zeros((1, 1, 10), dtype=np.int64)
+    X_inventories[0, 0, 2] = 10
+    Y_production = np.zeros((1, 1, 10), dtype=np.int64)
+
+    produce_Y(X_inventories, Y_production, make_decisions(), np.array([0]), np.array([[5000.0]]), np.array([9]), grid)
+    # 10 X at 1.5 X per Y : 6 Y are produced from 9 X
+    assert Y_production[0, 0, 0] == 6
+    assert X_inventories[0, 0, 2] == 1
+
+
+def test_produce_Y_uses_the_factory_region():
+    grid = CompatibilityGrid(pd.DataFrame(np.ones((10, 10))))
+    X_inventories = np.zeros((1, 2, 10), dtype=np.int64)
+    X_inventories[0, :, 3] = 500
+    Y_production = np.zeros((1, 2, 10), dtype=np.int64)
+
+    produce_Y(X_inventories, Y_production, make_decisions(), np.array([0]), np.array([[5000.0]]), np.array([9]), grid,
+              regions=np.array([[1]]))
+    # The factory is in region 2 : it only uses the X held there and its Y stay there
+    assert Y_production[0, :, 0].tolist() == [0, 500]
+    assert X_inventories[0, :, 3].tolist() == [500, 0]
+
+def test_production_log_levels(capsys):
+    grid = CompatibilityGrid(pd.DataFrame(np.ones((10, 10))))
+    decisions = make_decisions(Company=[1, 1, 2], Grade=[0, 1, 0], Volume=[300, 400, 100], Factory=[1, 1, 1])
+    runs = {}
+    for level in (ProductionLog.OFF, ProductionLog.RECORD, ProductionLog.PRINT):
+        X_inventories = np.zeros((2, 1, 10), dtype=np.int64)
+        X_inventories[:, 0, [2, 5]] = [[500, 100], [50, 0]]
+        log = ProductionLog(level, capacity=1)
+        produce_Y(X_inventories, np.zeros((2, 1, 10), dtype=np.int64), decisions, np.array([0, 0, 1]),
+                  np.full((2, 1), 5000.0), np.array([9, 9]), grid, log=log, quarter=3)
+        runs[level] = (log.to_frame(), capsys.readouterr().out)
+
+    assert runs[ProductionLog.OFF][0].empty and runs[ProductionLog.OFF][1] == ''
+    frame, printed = runs[ProductionLog.RECORD]
+    assert printed == ''
+    # Company 1 uses its Std X (grade 2) first, then its Dlx X (grade 5) once grade 2 runs out
+    assert frame.values.tolist() == [
+        [3, 1, 0, 2, 300, 300],
+        [3, 1, 1, 2, 200, 200],
+        [3, 1, 1, 5, 100, 100],
+        [3, 2, 0, 2, 50, 50],
+    ]
+    assert runs[ProductionLog.PRINT][0].equals(frame)
+    # The layout of the production prints the log replaced, one block per decision
+    assert runs[ProductionLog.PRINT][1] == (
+        "Quarter 3, Company 1:\n Company 1, Production of Y0:\n  - Grade X2 used: 300\n\n"
+        "Quarter 3, Company 1:\n Company 1, Production of Y1:\n  - Grade X2 used: 200\n  - Grade X5 used: 100\n\n"
+        "Quarter 3, Company 2:\n Company 2, Production of Y0:\n  - Grade X2 used: 50\n\n"
+    )
+
+def test_session_exports_the_production_log(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    session = Session(DATA_PATH, use_cache=False, production_log_level=ProductionLog.RECORD)
+    session.runSessions(3)
+    # Company 1 produces Y0 and Y1 from its X0 in the third quarter of Data.xlsx
+    assert session.production_log.to_frame().values.tolist() == [[3, 1, 0, 0, 20000, 20000], [3, 1, 1, 0, 20000, 10000]]
+
+    session.export_production_log(tmp_path / 'production_log.csv')
+    exported = pd.read_csv(tmp_path / 'production_log.csv')
+    assert exported.columns.tolist() == ['Quarter', 'Company', 'Grade', 'X_Grade', 'X_Used', 'Y_Produced']
+    assert exported.equals(session.production_log.to_frame())
+
+def test_decisions_are_grouped_by_quarter_company_and_item():
+    decisions = Session(DATA_PATH, use_cache=False).production_decisions
+    data = decisions.get_data()
+    for (quarter, cid, item), _ in data.groupby(['Quarter', 'Company', 'Item']):
+        expected = data.query(f"Quarter == {quarter}").query(f"Company == {cid}").query(f"Item == '{item}'")
+        pd.testing.assert_frame_equal(decisions.get_company_decisions(quarter, cid, item), expected)
+        pd.testing.assert_frame_equal(decisions.get_item_decisions(quarter, item), data.query(f"Quarter == {quarter} and Item == '{item}'"))
+    assert decisions.get_company_decisions(99, 1, 'X').empty and decisions.get_item_decisions(99, 'Y').empty
+
+def test_production_evaluates_no_query(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    session = Session(DATA_PATH, use_cache=False)
+    # Company 1 acquires its factories and produces X0 in the first quarters of Data.xlsx
+    session.runSessions(2)
+    def query(*args, **kwargs):
+        raise AssertionError("production decisions are looked up, not queried")
+    monkeypatch.setattr(pd.DataFrame, 'query', query)
+
+    session.run_production()
+    # In the third quarter, company 1 produces X1 in two factories, and Y0 and Y1 from its X0
+    production = session.marketPlayers.get_inventory_array('production')[0, 0]
+    assert production[0].nonzero()[0].tolist() == [1]
+    assert production[1, [0, 1]].tolist() == [20000, 10000]
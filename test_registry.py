@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from registry import Registry, partition
+from production import ProductionRegistry
+from RD import Biddings
+
+
+def make_decisions() -> pd.DataFrame:
+    return pd.DataFrame({
+        'Quarter': [2, 1, 2, 2, 3], 'Company': [1, 2, 2, 1, 1], 'Item': ['X', 'Y', 'Y', 'Y', 'X'], 'Volume': [10, 20, 30, 40, 50],
+        })
+
+def test_partitions_match_the_queries():
+    data = make_decisions()
+    registry = Registry(data)
+    for quarter in (1, 2, 3):
+        pd.testing.assert_frame_equal(registry.get_quarter(quarter), data.query(f"Quarter == {quarter}"))
+        for cid in (1, 2):
+            pd.testing.assert_frame_equal(registry.get_company(quarter, cid), data.query(f"Quarter == {quarter} and Company == {cid}"))
+    # Missing partitions are empty frames with the registry columns
+    assert registry.get_quarter(7).empty and registry.get_quarter(7).columns.equals(data.columns)
+    assert registry.get_company(1, 1).empty
+
+def test_partition_keeps_the_index_and_order():
+    groups = partition(make_decisions(), ['Quarter', 'Company'])
+    assert list(groups) == [(2, 1), (1, 2), (2, 2), (3, 1)]
+    assert groups[(2, 1)].index.tolist() == [0, 3]
+    assert partition(make_decisions().iloc[0:0], 'Quarter') == {}
+
+def test_production_registry_lookups_match_the_queries():
+    data = make_decisions()
+    registry = ProductionRegistry(data)
+    pd.testing.assert_frame_equal(registry.get_current_registry(2), data.query("Quarter == 2").reset_index())
+    pd.testing.assert_frame_equal(registry.get_company_registry(1), data.query("Company == 1").reset_index())
+    assert registry.get_current_registry(9).empty and 'index' in registry.get_current_registry(9).columns
+
+def test_biddings_read_their_partitions():
+    bids = pd.DataFrame({
+        'Quarter': [1, 1, 1, 2], 'Company': [1, 2, 3, 1], 'Bid_X': [10, 30, 0, 50],
+        'Partner_1_X': [2, np.nan, np.nan, 3], 'Partner_2_X': [np.nan] * 4,
+        })
+    biddings = Biddings(bids, n_winners=3)
+    assert biddings.get_winners(1, 'X').tolist() == [2, 1]
+    assert biddings.get_partners(1, 1, 'X').tolist() == [2]
+    assert biddings.get_partners(1, 2, 'X').tolist() == [3]
+    assert biddings.get_partners(3, 2, 'X').tolist() == []
@@ -0,0 +1,116 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from session import Session
+from sales import SalesRegistry, get_market_shares, run_batched_sales_protocol, run_sales_protocol, split_regional_demands
+from salesHelpers.prices import PostedPrices
+
+DATA_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_water_filling_sells_min_of_demand_and_inventory():
+    # Company 2 runs out of inventory, its remaining demand goes to companies 1 and 3 in proportion to their shares
+    sales = run_sales_protocol([100, 10, 100], [0.5, 0.3, 0.2], 150)
+    assert sales.tolist() == [100, 10, 40]
+    assert run_sales_protocol([30, 10, 20], [0.5, 0.3, 0.2], 150).tolist() == [30, 10, 20]
+
+def test_redistribution_reaches_the_first_company():
+    # Only company 1 has units left after the first allocation : it must take the remaining demand
+    assert run_sales_protocol([100, 10, 10], [0.2, 0.4, 0.4], 100).tolist() == [80, 10, 10]
+
+def test_batched_markets_are_independent():
+    inventories = np.array([[[100, 10, 100], [100, 100, 100]], [[0, 0, 5], [100, 100, 100]]])
+    shares = np.array([[[0.5, 0.3, 0.2], [0.7, -0.2, 0.5]], [[0.5, 0.5, 0], [0, 0, 0]]])
+    demands = np.array([[150, 150], [20, 50]])
+    sales = run_batched_sales_protocol(inventories, shares, demands)
+    assert sales.shape == inventories.shape
+    assert sales[0, 0].tolist() == [100, 10, 40]
+    assert sales[0, 1].sum() == 150 and sales[0, 1].min() >= 0
+    # Company 3 has stock but no share, companies 1 and 2 have a share but no stock
+    assert sales[1, 0].tolist() == [0, 0, 0]
+    assert sales[1, 1].tolist() == [0, 0, 0]
+
+def test_negative_shares_are_treated_as_zero():
+    sales = run_sales_protocol([100, 100, 100], [0.7, -0.2, 0.5], 150)
+    assert sales.min() >= 0
+    assert sales[1] == 0
+    assert sales.sum() == 150
+
+def test_zero_shares_sell_nothing():
+    assert run_sales_protocol([100, 100], [0, 0], 50).tolist() == [0, 0]
+    assert run_sales_protocol([100, 100], [-0.5, 0], 50).tolist() == [0, 0]
+
+def test_price_change_factor_is_applied_once(monkeypatch):
+    session = Session(DATA_PATH, use_cache=False)
+    session.quarter = 3
+    n_companies = len(session.marketPlayers)
+    # Every company posts 100 for X0 ; company 2 posted 80 in the previous quarter, the others 100
+    prices = np.zeros((n_companies, 2, 10), dtype=np.int64)
+    prices[:, 0, 0] = 100
+    previous = prices.copy()
+    previous[1, 0, 0] = 80
+    average = np.full((2, 10), np.nan)
+    average[0, 0] = 100
+    posted_prices = PostedPrices(prices, np.zeros(prices.shape, dtype=bool), previous, average)
+    monkeypatch.setattr(session.sales_registry, 'get_posted_prices', lambda quarter: posted_prices)
+
+    impact = session.period_parameters.get_quarter_values(['Price change factor'], session.quarter)[0]
+    shares = get_market_shares(session)[0, 0]
+    # All other factors are equal : the share ratio is the price change factor, 1 - impact * |80 - 100| / 100
+    assert np.isclose(shares[1] / shares[0], 1 - impact * 20 / 100)
+
+def make_sales(rows) -> pd.DataFrame:
+    columns = ['Quarter', 'Company', 'Std_X', 'Price_Std_X', 'Dlx_X', 'Price_Dlx_X', 'Advertising_X',
+               'Std_Y', 'Price_Std_Y', 'Dlx_Y', 'Price_Dlx_Y', 'Advertising_Y']
+    return pd.DataFrame(rows, columns=columns)
+
+def test_previous_prices_are_those_of_the_previous_quarter():
+    sales = make_sales([
+        [1, 1, 3, 80, None, None, 0, None, None, 5, 300, 0],
+        [2, 1, 3, 100, None, None, 0, None, None, 5, 280, 0],
+        [2, 2, 3, 90, None, None, 0, None, None, None, None, 0],
+    ])
+    registry = SalesRegistry(sales, n_companies=2)
+
+    first = registry.get_posted_prices(1)
+    assert not first.previous.any()
+    second = registry.get_posted_prices(2)
+    assert second.previous[0, 0, 3] == 80 and second.prices[0, 0, 3] == 100
+    assert second.previous[0, 1, 5] == 300 and second.prices[0, 1, 5] == 280
+    # Company 2 didn't post anything in quarter 1
+    assert second.previous[1, 0, 3] == 0 and second.prices[1, 0, 3] == 90
+    assert np.array_equal(second.previous, first.prices)
+
+def test_non_finite_inputs_are_rejected():
+    # e.g a market share computed from a parameter missing for the quarter
+    with pytest.raises(ValueError, match=r'market share nan in market \(1, 2\)'):
+        run_batched_sales_protocol(np.full((2, 3), 100), np.array([[0.5, 0.5, 0], [0.2, 0.3, np.nan]]), np.array([10, 10]))
+    with pytest.raises(ValueError, match=r'demand nan in market \(1,\)'):
+        run_batched_sales_protocol(np.full((2, 3), 100), np.full((2, 3), 0.3), np.array([10, np.nan]))
+    with pytest.raises(ValueError, match='demand'):
+        split_regional_demands(np.array([[10, np.inf]]), 2)
+
+def test_market_summary_is_computed_once_per_quarter():
+    period_parameters = Session(DATA_PATH, use_cache=False).period_parameters
+    sales = make_sales([
+        [2, 1, 3, 100, 3, 120, 1000, None, None, 5, 300, 500],
+        [2, 2, 3, 90, 7, 150, 2000, None, None, None, None, 0],
+        [2, 3, None, None, None, None, 0, 1, 50, None, None, 0],
+        [3, 1, 4, 100, None, None, 0, None, None, None, None, 0],
+    ])
+    registry = SalesRegistry(sales, n_companies=3, period_parameters=period_parameters)
+    summary = registry.get_market_summary(2)
+    assert registry.get_market_summary(2) is summary
+
+    # Company 1 posts X3 in both standards : it is counted once
+    assert summary.sellers_per_grade[0].tolist() == [0, 0, 0, 2, 0, 0, 0, 1, 0, 0]
+    assert summary.sellers_per_grade[1].tolist() == [0, 1, 0, 0, 0, 1, 0, 0, 0, 0]
+    assert [grades.tolist() for grades in summary.grades_sold] == [[3, 7], [1, 5]]
+    assert summary.n_grades_sold.tolist() == [2, 2]
+    assert summary.n_std_sellers.tolist() == [2, 1] and summary.n_dlx_sellers.tolist() == [2, 1]
+    assert summary.total_advertising.tolist() == [3000, 500]
+    assert np.isclose(summary.climate_factor, period_parameters.get_values('Market climate factor', [2])[0] / 100)
+    assert summary.market_potentials.tolist() == period_parameters.get_quarter_values(['Mkt potential X', 'Mkt potential Y'], 2).tolist()
+    assert registry.get_grades_sold(3, 'X').tolist() == [4] and registry.get_n_grades_sold(3, 'Y') == 0
@@ -0,0 +1,55 @@
+import os
+import numpy as np
+
+import session as session_module
+from session import Session
+from sales import split_regional_demands
+
+DATA_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_split_regional_demands_keeps_the_total():
+    demands = np.array([[10, 7, 0], [3, 1, 2]])
+    regional = split_regional_demands(demands, 2)
+    assert regional.shape == (2, 2, 3)
+    assert (regional.sum(axis=0) == demands).all()
+    assert regional[:, 0, 1].tolist() == [4, 3]
+    assert (split_regional_demands(demands, 1)[0] == demands).all()
+
+def test_two_regions_share_the_demand_of_one(monkeypatch):
+    # Data.xlsx posts no retail prices : every company gets an equal share of markets of known demands
+    demands = np.arange(10) * 1000 + 1
+    monkeypatch.setattr(session_module, 'get_specific_market_demands', lambda session, item: demands)
+    monkeypatch.setattr(session_module, 'get_market_shares',
+                        lambda session: np.full((2, 10, len(session.marketPlayers)), 1 / len(session.marketPlayers)))
+    sold = {}
+    for n_regions in (1, 2):
+        session = Session(DATA_PATH, use_cache=False, n_regions=n_regions)
+        # Every company holds plenty of every grade in every region : each market sells its whole demand
+        session.marketPlayers.get_inventory_array('main')[:] = 10**9
+        session.sales()
+        sold[n_regions] = session.marketPlayers.get_inventory_array('sales')
+    assert sold[2].shape[1] == 2
+    assert sold[1].sum() == 2 * demands.sum()
+    # The demand is split across the regions rather than served again in each of them
+    assert (sold[2].sum(axis=(0, 1)) == sold[1].sum(axis=(0, 1))).all()
+    assert (sold[2].sum(axis=(0, 2, 3)) == split_regional_demands(demands, 2).sum(axis=-1) * 2).all()
+
+def test_sales_see_downgraded_inventories(monkeypatch, tmp_path):
+    # output.xlsx is written in the working directory
+    monkeypatch.chdir(tmp_path)
+    session = Session(DATA_PATH, use_cache=False)
+    inventories = session.marketPlayers.get_inventory_array('main')
+    inventories[:, :, :, [2, 5, 7]] = 100
+    seen = []
+    run_sales = Session.sales
+    def sales(self):
+        seen.append(self.marketPlayers.get_inventory_array('main').copy())
+        run_sales(self)
+    monkeypatch.setattr(Session, 'sales', sales)
+
+    session.runQuarter()
+    # The downgrade after Air receptions runs before sales : grades 5 went to grade 2, grade 7 was kept
+    assert ((seen[0] != 0).sum(axis=-1) <= 2).all()
+    assert (seen[0][..., 5] == 0).all()
+    assert (seen[0][..., 2] >= 200).all()
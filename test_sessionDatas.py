@@ -0,0 +1,82 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+
+from session import Session
+from sessionDatas import PeriodParameters, load_workbook_sheets, get_cache_path, check_regions
+
+DATA_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_cache_round_trip_without_pickle(tmp_path):
+    workbook = tmp_path / 'Data.xlsx'
+    shutil.copy(os.path.join(DATA_PATH, 'Data.xlsx'), workbook)
+    parsed = load_workbook_sheets(workbook, use_cache=True)
+    cache_path = get_cache_path(workbook)
+    assert cache_path.endswith('.npz') and os.path.exists(cache_path)
+
+    # The cache only holds plain arrays : it can be loaded with pickle disabled
+    with np.load(cache_path, allow_pickle=False) as cache:
+        assert all(cache[name].dtype != object for name in cache.files)
+
+    cached = load_workbook_sheets(workbook, use_cache=True)
+    assert list(cached) == list(parsed)
+    for name in parsed:
+        pd.testing.assert_frame_equal(cached[name], parsed[name])
+
+def test_cache_is_ignored_once_the_workbook_changes(tmp_path):
+    workbook = tmp_path / 'Data.xlsx'
+    shutil.copy(os.path.join(DATA_PATH, 'Data.xlsx'), workbook)
+    sheets = {'Companies': {}}
+    load_workbook_sheets(workbook, sheets=sheets, use_cache=True)
+
+    companies = pd.read_excel(workbook, sheet_name='Companies')
+    companies.loc[0, 'Name'] = 'Renamed'
+    with pd.ExcelWriter(workbook) as writer:
+        companies.to_excel(writer, sheet_name='Companies', index=False)
+    assert load_workbook_sheets(workbook, sheets=sheets, use_cache=True)['Companies'].loc[0, 'Name'] == 'Renamed'
+
+def test_regions_above_n_regions_are_rejected():
+    sheets = {
+        'B2B Transactions': pd.DataFrame({'Selling Region': [1, 2], 'Buying Region': [1, None]}),
+        'Acquisitions':     pd.DataFrame({'Region': [1, 3]}),
+        'Production':       pd.DataFrame({'Region': pd.Series([], dtype=float)}),
+    }
+    check_regions(sheets, 3)
+    # A stray region doesn't grow the game : it is reported with its sheet row
+    with pytest.raises(ValueError, match='Acquisitions row 3 has Region = 3'):
+        check_regions(sheets, 2)
+    with pytest.raises(ValueError, match='Selling Region = 2'):
+        check_regions(sheets, 1)
+
+def test_n_regions_is_bounded_by_the_transfer_areas():
+    assert Session(DATA_PATH, use_cache=False).n_regions == 1
+    with pytest.raises(ValueError, match='3 areas'):
+        Session(DATA_PATH, use_cache=False, n_regions=4)
+
+def test_period_parameters_match_the_sheet():
+    sheet = load_workbook_sheets(os.path.join(DATA_PATH, 'Data.xlsx'), sheets={'Parameters': {}})['Parameters']
+    parameters = PeriodParameters(sheet.copy())
+    # Every indexed lookup returns what the boolean-mask scan of the sheet returned
+    for name in sheet.iloc[:, 0].dropna().unique():
+        scanned = sheet.loc[sheet.iloc[:, 0] == name].values[0, 1:].astype(float)
+        np.testing.assert_array_equal(parameters.get_values(name), scanned)
+        np.testing.assert_array_equal(parameters.get_values(name, [1, 3]), scanned[[0, 2]])
+
+    names = ['Mkt potential Y', 'Market climate factor', 'Stock out penalty X']
+    values = parameters.get_quarter_values(names, 4)
+    assert values.dtype == np.float64
+    assert values.tolist() == [parameters.get_values(name, [4])[0] for name in names] == [18720, 104, 0.8]
+    with pytest.raises(KeyError, match='Unknown parameter'):
+        parameters.get_values('Unknown parameter')
+    with pytest.raises(KeyError):
+        parameters.get_quarter_values(['Unknown parameter'], 1)
+    with pytest.raises(ValueError):
+        parameters.values[0, 0] = 0
+
+def test_duplicated_parameters_use_their_first_row():
+    parameters = PeriodParameters(pd.DataFrame({'Name': ['A', 'B', 'A'], 'Period 1': [1.0, 2.0, 3.0]}))
+    assert parameters.get_values('A').tolist() == [1.0]
+    assert parameters.get_quarter_values(['B', 'A'], 1).tolist() == [2.0, 1.0]
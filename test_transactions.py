@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pandas as pd
+
+from session import Session
+from sessionDatas import TransferCostGrid
+import transactions as transactions_module
+from transactions import SOLD, BOUGHT, TransactionRegistry, compile_transfer_deltas
+
+DATA_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_registry(tmp_path) -> TransactionRegistry:
+    transactions = pd.DataFrame({
+        'Quarter': [2, 2, 2], 'Seller': [1, 3, 2], 'Selling Region': [1, 1, 2], 'Buyer': [6, 4, 1], 'Buying Region': [1, 1, 3],
+        'Product': ['X', 'Y', 'X'], 'Grade': [0, 1, 2], 'Air / Surface': ['Air', 'Surface', 'Air'], 'Volume': [3500, 8500, 12000],
+        })
+    return TransactionRegistry(path=tmp_path / 'missing.xlsx', data=transactions)
+
+def test_transfer_costs_follow_the_grid_object(tmp_path):
+    grid = Session(DATA_PATH, use_cache=False).transferCosts
+    registry = make_registry(tmp_path)
+    costs = registry.get_transfer_costs(2, grid)
+    assert (costs > 0).all()
+    assert registry.get_transfer_costs(2, grid) is costs
+
+    # Another grid with doubled prices is priced again (the cache doesn't rely on ids, which can be reused)
+    doubled = TransferCostGrid.__new__(TransferCostGrid)
+    doubled.__dict__.update(grid.__dict__)
+    doubled.prices = grid.prices * 2
+    doubled_costs = registry.get_transfer_costs(2, doubled)
+    np.testing.assert_allclose(doubled_costs, costs * 2)
+    np.testing.assert_allclose(registry.get_transfer_costs(2, grid), costs)
+
+def test_transfer_deltas_follow_the_trading_regions(tmp_path):
+    transactions = make_registry(tmp_path).get_quarter(2)
+    deltas = compile_transfer_deltas(transactions, n_companies=6, n_regions=2)
+    assert deltas.shape == (2, 2, 6, 2, 2, 10)
+    # Company 2 sells 12000 X2 by air from region 2 ; company 1 buys them in region 3, which doesn't exist
+    assert deltas[SOLD, 0, 1, 1, 0, 2] == 12000
+    assert deltas[SOLD, 0, 1, 0].sum() == 0
+    assert deltas[BOUGHT, 0, 0].sum() == 0
+    assert deltas[BOUGHT, 1, 3, 0, 1, 1] == 8500
+    assert deltas[SOLD].sum() == 3500 + 8500 + 12000
+    assert deltas[BOUGHT].sum() == 3500 + 8500
+
+def test_update_reparses_only_changed_files(tmp_path, monkeypatch):
+    workbook = tmp_path / 'Data.xlsx'
+    transactions = make_registry(tmp_path).data
+    transactions.to_excel(workbook, sheet_name='B2B Transactions', index=False)
+    reads = []
+    read_excel = pd.read_excel
+    def counted_read_excel(*args, **kwargs):
+        reads.append(args)
+        return read_excel(*args, **kwargs)
+    monkeypatch.setattr(transactions_module.pd, 'read_excel', counted_read_excel)
+
+    registry = TransactionRegistry(path=workbook)
+    deltas = registry.get_transfer_deltas(2, 6)
+    registry.update()
+    # Same (mtime, size) : nothing is parsed again and the per-quarter results are kept
+    assert len(reads) == 1
+    assert registry.get_transfer_deltas(2, 6) is deltas
+
+    transactions.loc[0, 'Volume'] = 100
+    transactions.to_excel(workbook, sheet_name='B2B Transactions', index=False)
+    stat = os.stat(workbook)
+    os.utime(workbook, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    registry.update()
+    assert len(reads) == 2
+    assert registry.get_quarter(2)['Volume'].tolist() == [100, 8500, 12000]
+    assert registry.get_transfer_deltas(2, 6)[SOLD, 0, 0, 0, 0, 0] == 100
@@ -1,7 +1,17 @@
+import numpy as np
 import pandas as pd
 import os
 
-class TransactionRegistry:
+from registry import Registry
+from salesHelpers.prices import ITEMS, ITEM_INDEX, N_GRADES
+
+# Transport modes, in the order of the mode axis of the transfer deltas
+MODES = ('Air', 'Surface')
+MODE_INDEX = {mode: index for index, mode in enumerate(MODES)}
+# Sides of the transfer deltas
+SOLD, BOUGHT = 0, 1
+
+class TransactionRegistry(Registry):
     """
     The registry of transactions.
 
@@ -12,44 +22,98 @@ class TransactionRegistry:
 
     Methods
     -------
-    update(dataFrame)
-        Replaces the transaction registry with the given dataframe.
+    update()
+        Reloads the transaction registry if its source file has changed since the last load.
     get_quarter(quarter)
         Returns the transactions corresponding to the requested quarter.
     filter_type(t_type)
         Returns the transactions dataframe corresponding to the requested transport type.
+    get_transfer_deltas(quarter, n_companies, n_regions)
+        Returns the volumes sold and bought by every company in the quarter, per transport mode, region, item and grade.
+    get_transfer_costs(quarter, grid)
+        Returns the transfer cost of every transaction of the quarter.
     """
+    company_column = None # Transactions have a seller and a buyer rather than a company
 
     def __init__(self, path:os.PathLike, data:pd.DataFrame=None) -> None:
         self.path = path
-        self.data = data
+        self.data = None
+        self._file_stamp = None
+        if data is None:
+            self.update()
+        else:
+            self._set_data(data)
+            self._file_stamp = self._get_file_stamp()
 
-    def update(self) -> None:
+    def _set_data(self, df: pd.DataFrame) -> None:
+        super()._set_data(df)
+        self._transfer_deltas = {}
+        self._transfer_costs = {}
+
+    def get_transfer_deltas(self, quarter: int, n_companies: int, n_regions: int = 1) -> np.ndarray:
         """
-        Replaces the transaction registry with the given dataframe.
+        Returns the volumes sold and bought by every company in the quarter (computed once per quarter and reload).
 
         Parameters
         ----------
-        dataFrame : pd.DataFrame
-            The new transaction registry dataframe.
+        quarter : int
+            The demanded quarter (starts at 1).
+        n_companies : int
+            The number of companies, i.e the size of the company axis. Companies are indexed by `company id - 1`.
+        n_regions : int
+            The number of regions, i.e the size of the region axis. Regions are indexed by `region - 1`.
+
+        Returns
+        -------
+        np.ndarray
+            Read-only int array of shape [side (SOLD, BOUGHT), mode (Air, Surface), company, region, item, grade].
         """
-        self.data = pd.read_excel(self.path, sheet_name='B2B Transactions')
+        key = (quarter, n_companies, n_regions)
+        if key not in self._transfer_deltas:
+            deltas = compile_transfer_deltas(self.get_quarter(quarter), n_companies, n_regions)
+            deltas.flags.writeable = False
+            self._transfer_deltas[key] = deltas
+        return self._transfer_deltas[key]
 
-    def get_quarter(self, quarter: int) -> pd.DataFrame:
+    def get_transfer_costs(self, quarter: int, grid) -> np.ndarray:
         """
-        Returns the transactions corresponding to the requested quarter.
+        Returns the transfer cost of every transaction of the quarter, in the order of `get_quarter(quarter)`
+        (computed once per quarter, grid and reload).
 
         Parameters
         ----------
         quarter : int
-            The requested quarter.
+            The demanded quarter (starts at 1).
+        grid : TransferCostGrid
+            The grid pricing the transfers (a session attribute).
+        """
+        # The grid is kept with its costs and compared by identity : a grid given later is never served stale costs
+        cached = self._transfer_costs.get(quarter)
+        if cached is None or cached[0] is not grid:
+            costs = grid.price_transactions(self.get_quarter(quarter))
+            costs.flags.writeable = False
+            cached = self._transfer_costs[quarter] = (grid, costs)
+        return cached[1]
 
-        Returns
-        -------
-        pd.DataFrame
-            The transactions dataframe for the requested quarter.
+    def update(self) -> None:
+        """
+        Reloads the transaction registry from the 'B2B Transactions' sheet of the source file.\n
+        Nothing is read if the file is unchanged since the last load, so that calling it every quarter
+        only costs a `stat` while mid-game edits are still picked up.
         """
-        return self.data[self.data["Quarter"] == quarter]
+        file_stamp = self._get_file_stamp()
+        if self.data is not None and file_stamp == self._file_stamp:
+            return
+        self._set_data(pd.read_excel(self.path, sheet_name='B2B Transactions'))
+        self._file_stamp = file_stamp
+
+    def _get_file_stamp(self) -> tuple:
+        """Returns the (modification time, size) of the source file, or None if it cannot be read."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
 
     def filter_type(self, t_type: str) -> pd.DataFrame:
         """
@@ -68,6 +132,44 @@ class TransactionRegistry:
         assert t_type in ['Air', 'Surface'], "Parameter {} is not a recognized transport mode.".format(t_type)
         return self.data[self.data["Air / Surface"] == t_type]
 
+def compile_transfer_deltas(transactions: pd.DataFrame, n_companies: int, n_regions: int = 1) -> np.ndarray:
+    """
+    Pivots B2B transactions into the volumes sold and bought by every company.
+
+    Sold volumes leave the selling region of the seller, bought volumes arrive in the buying region of the buyer.
+    Volumes of the same company, mode, region, item and grade are summed before being truncated to whole units.
+    Transactions of unknown companies, modes, regions, items or grades are ignored.
+
+    Parameters
+    ----------
+    transactions : pd.DataFrame
+        The transactions (usually those of one quarter).
+    n_companies : int
+        The number of companies, i.e the size of the company axis. Companies are indexed by `company id - 1`.
+    n_regions : int
+        The number of regions, i.e the size of the region axis. Regions are indexed by `region - 1`.
+
+    Returns
+    -------
+    np.ndarray
+        int array of shape [side (SOLD, BOUGHT), mode (Air, Surface), company, region, item, grade].
+    """
+    deltas = np.zeros((2, len(MODES), n_companies, n_regions, len(ITEMS), N_GRADES))
+    modes = transactions["Air / Surface"].map(MODE_INDEX).to_numpy(dtype=float)
+    items = transactions["Product"].map(ITEM_INDEX).to_numpy(dtype=float)
+    grades = pd.to_numeric(transactions["Grade"], errors='coerce').to_numpy(dtype=float)
+    volumes = pd.to_numeric(transactions["Volume"], errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(modes) & ~np.isnan(items) & (grades >= 0) & (grades < N_GRADES) & ~np.isnan(volumes)
+
+    for side, column, region_column in ((SOLD, "Seller", "Selling Region"), (BOUGHT, "Buyer", "Buying Region")):
+        companies = pd.to_numeric(transactions[column], errors='coerce').to_numpy(dtype=float) - 1
+        regions = pd.to_numeric(transactions[region_column], errors='coerce').to_numpy(dtype=float) - 1
+        rows = np.flatnonzero(valid & (companies >= 0) & (companies < n_companies) & (regions >= 0) & (regions < n_regions))
+        index = tuple(axis[rows].astype(int) for axis in (modes, companies, regions, items, grades))
+        np.add.at(deltas[side], index, volumes[rows])
+
+    return np.trunc(deltas).astype(np.int64)
+
 if __name__ == "__main__":
     df = pd.read_excel("./Transaction_Registry.xlsx")
     T = TransactionRegistry()